@@ -23,19 +23,143 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import json
 import sys
 
+from libregice import Regice
 from memtool.memtool import MemtoolPrompt
-from regicecommon.helpers import init_argument_parser, init_regice
+from memtool.mmapclient import MmapClient, get_peripheral_regions
+from memtool.output import OUTPUT_FORMATS
+from memtool.server import serve
+from memtool.svdindex import build_device_index, load_device_index
+from memtool.trace import ReplayClient, TraceWriter
+from regicecommon.helpers import init_argument_parser, init_regice, load_svd
+
+class DeferredRegice:
+    """
+        A proxy that creates the regice instance on first use
+
+        Creating regice parses the SVD and connects to the target.
+        When the index of the SVD has been loaded from disk, commands
+        that only need the index (e.g. 'peripherals list') never pay for it.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.regice = None
+        self.index = None
+        self.hooks = []
+
+    def create_regice(self):
+        """
+            Create the regice instance, with the client selected by the arguments
+
+            :return: The regice instance
+        """
+        if getattr(self.args, 'replay', None):
+            return Regice(ReplayClient(self.args.replay), load_svd(self.args.svd))
+        if getattr(self.args, 'mmap', None):
+            regice = Regice(None, load_svd(self.args.svd))
+            index = self.index
+            if index is None:
+                index = build_device_index(regice)
+            regice.client = MmapClient(self.args.mmap,
+                                       get_peripheral_regions(index))
+            return regice
+        return init_regice(self.args)
+
+    def __getattr__(self, name):
+        if self.regice is None:
+            self.regice = self.create_regice()
+            for hook in self.hooks:
+                hook(self.regice)
+        return getattr(self.regice, name)
+
+    def add_init_hook(self, hook):
+        """
+            Register a function to call once regice has been created
+
+            :param hook: A function that takes the regice instance
+        """
+        if self.regice is None:
+            self.hooks.append(hook)
+        else:
+            hook(self.regice)
+
+def load_target(args):
+    """
+        Create the regice instance and load the SVD index of a target
+
+        :param args: The parsed command line arguments
+        :return: A tuple (regice, index). The index is None if there is no SVD
+                 file to index.
+    """
+    regice = DeferredRegice(args)
+    index = None
+    svd_file = getattr(args, 'svd', None)
+    if svd_file:
+        index = load_device_index(svd_file, regice, args.rebuild_index)
+    regice.index = index
+    return regice, index
 
 def main(argv):
     parser = init_argument_parser([])
+    parser.add_argument('--rebuild-index', action='store_true',
+                        help='Parse the SVD again and update the saved index')
+    parser.add_argument('-x', '--script', metavar='FILE',
+                        help='Run the commands of a script file, and exit')
+    parser.add_argument('-c', '--command', metavar='COMMANDS',
+                        help="Run commands separated by ';', and exit")
+    parser.add_argument('--serve', metavar='SOCKET',
+                        help='Serve commands on a Unix socket '
+                             '(see python -m memtool.client)')
+    parser.add_argument('--format', choices=list(OUTPUT_FORMATS), default='text',
+                        help='Output format of register values')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Save the target access statistics as JSON at exit')
+    parser.add_argument('--record', metavar='FILE',
+                        help='Append all the target accesses to a trace file')
+    parser.add_argument('--mmap', metavar='FILE',
+                        help='Access the registers by mapping a memory device '
+                             '(e.g. /dev/mem) or a file, '
+                             'instead of connecting to a target')
+    parser.add_argument('--replay', metavar='FILE',
+                        help='Serve the target reads from a trace file, '
+                             'instead of connecting to a target')
     args = parser.parse_args(argv)
-    regice = init_regice(args)
+    regice, index = load_target(args)
+
+    def target_factory(target_argv):
+        try:
+            return load_target(parser.parse_args(target_argv))
+        except SystemExit:
+            raise SyntaxWarning("Invalid target arguments")
+
+    prompt = MemtoolPrompt(regice, index)
+    prompt.target_factory = target_factory
+    prompt.output_format = args.format
+    trace = None
+    if args.record:
+        trace = TraceWriter(args.record)
+        prompt.record(trace)
+    try:
+        if args.script:
+            with open(args.script) as script:
+                sys.exit(0 if prompt.run_commands(script) else 1)
+        if args.command:
+            sys.exit(0 if prompt.run_commands(args.command.split(';')) else 1)
+        if args.serve:
+            serve(prompt, args.serve)
+            return
 
-    prompt = MemtoolPrompt(regice)
-    prompt.prompt = 'Memtool> '
-    prompt.cmdloop()
+        prompt.prompt = 'Memtool> '
+        prompt.cmdloop()
+    finally:
+        prompt.stop_logs()
+        if trace is not None:
+            trace.close()
+        if args.profile:
+            with open(args.profile, 'w') as profile:
+                json.dump(prompt.stats.to_dict(), profile, indent=2)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
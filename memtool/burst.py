@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+class Burst:
+    """
+        A set of registers read using a single block transfer
+
+        All the registers of a burst have the same size, and are aligned
+        on it. The burst covers every word from the first register to the
+        end of the last one, including the gaps between them.
+    """
+    def __init__(self, register):
+        self.address = register.address
+        self.width = register.size
+        self.registers = [register]
+
+    def end(self):
+        """
+            :return: The address right after the last register of the burst
+        """
+        last = self.registers[-1]
+        return last.address + last.size // 8
+
+    def count(self):
+        """
+            :return: The number of words covered by the burst
+        """
+        return (self.end() - self.address) // (self.width // 8)
+
+    def can_merge(self, register, gap, max_size, hazards):
+        """
+            Test if a register could be appended to the burst
+
+            :param register: The RegisterInfo to append
+            :param gap: The maximum number of bytes between two registers
+            :param max_size: The maximum size of the burst, in bytes
+            :param hazards: Registers that must never be read by the burst
+            :return: True if the register could be appended to the burst
+        """
+        if register.side_effect or self.registers[0].side_effect:
+            return False
+        if register.size != self.width or self.width % 8:
+            return False
+        if (register.address - self.address) % (self.width // 8):
+            return False
+        end = self.end()
+        if register.address - end > gap:
+            return False
+        if register.address + register.size // 8 - self.address > max_size:
+            return False
+        for hazard in hazards:
+            if end <= hazard.address < register.address:
+                return False
+        return True
+
+def plan_bursts(registers, gap, max_size, hazards=()):
+    """
+        Sort registers by address and merge them into bursts
+
+        :param registers: A list of RegisterInfo to read
+        :param gap: The maximum number of bytes between two registers
+                    of the same burst
+        :param max_size: The maximum size of a burst, in bytes
+        :param hazards: Registers that must never be read as part of a burst
+        :return: A list of Burst, sorted by address
+    """
+    bursts = []
+    for register in sorted(registers, key=lambda register: register.address):
+        if bursts and bursts[-1].can_merge(register, gap, max_size, hazards):
+            bursts[-1].registers.append(register)
+        else:
+            bursts.append(Burst(register))
+    return bursts
+
+def read_burst(client, burst):
+    """
+        Read all the registers of a burst
+
+        If the client supports block transfers (read_burst method),
+        this reads the whole burst at once and splits the buffer.
+        Otherwise, this falls back to one read per register, skipping the gaps.
+        Note that the libregice clients only provide read() and write(),
+        so with them a burst still costs one transaction per register.
+
+        :param client: The regice client to use
+        :param burst: The burst to read
+        :return: A list of tuple (RegisterInfo, value), sorted by address
+    """
+    if len(burst.registers) > 1 and hasattr(client, 'read_burst'):
+        step = burst.width // 8
+        words = client.read_burst(burst.width, burst.address, burst.count())
+        return [(register, words[(register.address - burst.address) // step])
+                for register in burst.registers]
+    return [(register, client.read(register.size, register.address))
+            for register in burst.registers]
+
+def write_burst(client, burst, values):
+    """
+        Write all the registers of a burst
+
+        The registers of the burst must be contiguous (no gap).
+        If the client supports block transfers (write_burst method),
+        this writes the whole burst at once. Otherwise, this falls back to
+        one write per register.
+
+        :param client: The regice client to use
+        :param burst: The burst to write
+        :param values: The values to write, one per register of the burst
+    """
+    if len(burst.registers) > 1 and hasattr(client, 'write_burst'):
+        client.write_burst(burst.width, burst.address, values)
+        return
+    for register, value in zip(burst.registers, values):
+        client.write(register.size, register.address, value)
+
+class WriteQueue:
+    """
+        A queue of register writes
+
+        Writes to the same register are collapsed, only the last value
+        is kept. The queue is flushed in address order, merging adjacent
+        registers into block transfers.
+    """
+    def __init__(self):
+        self.writes = {}
+
+    def get(self, peripheral, register):
+        """
+            Get the pending value of a register
+
+            :param peripheral: The name of the peripheral
+            :param register: The RegisterInfo of the register
+            :return: The value queued for the register, or None
+        """
+        write = self.writes.get((peripheral, register.name))
+        return None if write is None else write[1]
+
+    def put(self, peripheral, register, value):
+        """
+            Queue a register write
+
+            :param peripheral: The name of the peripheral
+            :param register: The RegisterInfo of the register
+            :param value: The value to write
+        """
+        self.writes[(peripheral, register.name)] = (register, value)
+
+    def flush(self, client, max_size):
+        """
+            Write all the queued values, and empty the queue
+
+            :param client: The regice client to use
+            :param max_size: The maximum size of a burst, in bytes
+            :return: A list of tuple (peripheral, RegisterInfo, value) written,
+                     in address order
+        """
+        values = {register.address: (peripheral, register, value)
+                  for (peripheral, _name), (register, value) in self.writes.items()}
+        self.writes = {}
+        registers = [write[1] for write in values.values()]
+        written = []
+        for burst in plan_bursts(registers, 0, max_size):
+            burst_values = [values[register.address] for register in burst.registers]
+            write_burst(client, burst, [write[2] for write in burst_values])
+            written.extend(burst_values)
+        return written
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+class ShadowCache:
+    """
+        A write-through cache of register values
+
+        Values are indexed by peripheral and register name.
+        Volatile registers (see RegisterInfo.is_volatile) are never cached.
+        The cache is disabled by default.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+
+    def get(self, peripheral, register):
+        """
+            Get the value of a register from the cache
+
+            :param peripheral: The name of the peripheral
+            :param register: The RegisterInfo of the register
+            :return: The cached value, or None if the register must be read
+        """
+        if not self.enabled:
+            return None
+        if register.volatile:
+            self.bypasses += 1
+            return None
+        value = self.values.get((peripheral, register.name))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def update(self, peripheral, register, value):
+        """
+            Update the value of a register, after a read or a write
+
+            :param peripheral: The name of the peripheral
+            :param register: The RegisterInfo of the register
+            :param value: The value read from, or written to the register
+        """
+        if self.enabled and not register.volatile:
+            self.values[(peripheral, register.name)] = value
+
+    def invalidate(self, peripheral, register):
+        """
+            Remove a register from the cache
+
+            :param peripheral: The name of the peripheral
+            :param register: The RegisterInfo of the register
+        """
+        self.values.pop((peripheral, register.name), None)
+
+    def flush(self, peripheral=None):
+        """
+            Remove all the registers of a peripheral, or all registers, from the cache
+
+            :param peripheral: The name of the peripheral, or None to flush everything
+        """
+        if peripheral is None:
+            self.values.clear()
+            return
+        for key in [key for key in self.values if key[0] == peripheral]:
+            del self.values[key]
+
+    def reset_stats(self):
+        """
+            Reset the hits, misses and bypasses counters
+        """
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# This module must stay lightweight: it does not import regice, nor the SVD
+# parser, so a client starts as fast as the Python interpreter.
+
+import json
+import socket
+import sys
+
+class MemtoolClient:
+    """
+        A client of the memtool server (see memtool --serve)
+
+        The connection is kept open, so a script can send many commands
+        without paying for a new connection each time.
+    """
+    def __init__(self, path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.file = self.socket.makefile('rwb')
+
+    def close(self):
+        """
+            Close the connection to the server
+        """
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    def run(self, command):
+        """
+            Run a command on the server
+
+            :param command: The command line
+            :return: The response, as a dictionary with the keys ok, result,
+                     output and error (see MemtoolRequestHandler)
+        """
+        self.file.write(json.dumps({'command': command}).encode() + b'\n')
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the server")
+        return json.loads(line.decode())
+
+def main(argv):
+    """
+        Run commands on a memtool server
+
+        Usage is python -m memtool.client <socket> [command [...]].
+        Without commands, this reads one command per line from stdin.
+
+        :param argv: The command line arguments
+        :return: 0 if all the commands succeeded, otherwise 1
+    """
+    if not argv:
+        print("usage: python -m memtool.client <socket> [command [...]]",
+              file=sys.stderr)
+        return 2
+    commands = argv[1:] if len(argv) > 1 else sys.stdin
+    with MemtoolClient(argv[0]) as client:
+        for command in commands:
+            command = command.strip()
+            if not command:
+                continue
+            response = client.run(command)
+            sys.stdout.write(response.get('output', ''))
+            if not response['ok']:
+                print(response['error'], file=sys.stderr)
+                return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
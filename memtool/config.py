@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import configparser
+import json
+import os
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+CONFIG_ERRORS = (OSError, ValueError, configparser.Error)
+if yaml is not None:
+    CONFIG_ERRORS += (yaml.YAMLError,)
+
+def flatten(spec, prefix=''):
+    """
+        Flatten nested mappings into a list of assignments
+
+        :param spec: A mapping of names to values, or to nested mappings
+        :param prefix: The name of the enclosing mapping, followed by '.'
+        :return: A list of tuple (name, value), in the order of the mapping
+    """
+    if not isinstance(spec, dict):
+        raise SyntaxWarning("Invalid configuration, expected a mapping")
+    assignments = []
+    for name, value in spec.items():
+        if isinstance(value, dict):
+            assignments.extend(flatten(value, prefix + str(name) + '.'))
+        else:
+            assignments.append((prefix + str(name), value))
+    return assignments
+
+def parse_value(name, value):
+    """
+        :param name: The name the value is assigned to
+        :param value: An integer, or a string with an integer (e.g. '0x10')
+        :return: The value, as an integer
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    try:
+        return int(str(value).strip(), 0)
+    except ValueError:
+        raise SyntaxWarning("Invalid value {} for {}".format(value, name))
+
+def load_config(path):
+    """
+        Load a register configuration file
+
+        The format depends on the file extension: JSON (.json), YAML (.yaml,
+        .yml, requires PyYAML) or INI (.ini, .cfg). Names are
+        peripheral.register[.field], and could be nested, e.g.
+        {"UART0": {"CTRL.EN": 1}}. INI sections are peripheral names.
+
+        :param path: The path of the configuration file
+        :return: A list of tuple (name, value), in the order of the file
+    """
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        with open(path) as config_file:
+            if extension in ('.yaml', '.yml'):
+                if yaml is None:
+                    raise SyntaxWarning("PyYAML is required to load " + path)
+                spec = yaml.safe_load(config_file)
+            elif extension in ('.ini', '.cfg'):
+                parser = configparser.ConfigParser()
+                parser.optionxform = str
+                parser.read_file(config_file)
+                spec = {section: dict(parser[section])
+                        for section in parser.sections()}
+            else:
+                spec = json.load(config_file)
+    except CONFIG_ERRORS as ex:
+        raise SyntaxWarning("Failed to load {}: {}".format(path, ex))
+    return [(name, parse_value(name, value)) for name, value in flatten(spec or {})]
+
+def resolve_config(index, assignments):
+    """
+        Resolve the names of a configuration, and group them per register
+
+        Field assignments to the same register are merged into a single
+        masked value. If some bits are assigned several times, the last
+        assignment wins.
+        Registers that could not be read (write-only registers, and
+        registers with read side effects) must be assigned as a whole, as
+        the value of their other fields is unknown.
+
+        :param index: The DeviceIndex of the target
+        :param assignments: A list of tuple (name, value), see load_config()
+        :return: A list of tuple (peripheral, RegisterInfo, mask, value),
+                 sorted by address. value is shifted to the register bits.
+    """
+    registers = {}
+    for name, value in assignments:
+        names = name.split('.')
+        if len(names) not in (2, 3):
+            raise SyntaxWarning("Invalid name " + name +
+                                ", expected peripheral.register[.field]")
+        peripheral = index.get_peripheral(names[0])
+        info = peripheral.registers.get(names[1])
+        if info is None:
+            raise SyntaxWarning("Invalid register " + name)
+        if len(names) == 3:
+            field = info.fields.get(names[2])
+            if field is None:
+                raise SyntaxWarning("Invalid field " + name)
+            if field.access == 'read-only':
+                raise SyntaxWarning("Read-only field " + name)
+            mask = field.mask
+            value = field.encode(value)
+        else:
+            mask = (1 << info.size) - 1
+            if value < 0 or value > mask:
+                raise SyntaxWarning("Value too large for register " + name)
+        if info.access == 'read-only':
+            raise SyntaxWarning("Read-only register " + name)
+        key = (peripheral.name, info.name)
+        _peripheral, _info, current_mask, current = registers.get(
+            key, (peripheral.name, info, 0, 0))
+        registers[key] = (peripheral.name, info, current_mask | mask,
+                          (current & ~mask) | value)
+    for peripheral, info, mask, _value in registers.values():
+        if ((info.is_write_only() or info.side_effect) and
+                mask != (1 << info.size) - 1):
+            raise SyntaxWarning("Register {}.{} could not be read, all its fields "
+                                "must be assigned".format(peripheral, info.name))
+    return sorted(registers.values(), key=lambda register: register[1].address)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import threading
+import time
+from contextlib import contextmanager
+
+from memtool.wrapper import ClientWrapper
+
+class CommandStats:
+    """
+        Statistics of the target accesses done by a command
+    """
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.target_time = 0.0
+        self.reads = 0
+        self.writes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.histogram = {}
+
+    def add_transaction(self, write, size, latency):
+        """
+            Account a target access
+
+            The latency histogram uses power of two buckets, in microseconds.
+
+            :param write: True for a write, False for a read
+            :param size: The number of bytes transferred
+            :param latency: The duration of the access, in seconds
+        """
+        if write:
+            self.writes += 1
+            self.bytes_written += size
+        else:
+            self.reads += 1
+            self.bytes_read += size
+        self.target_time += latency
+        bucket = 1 << int(latency * 1000000).bit_length()
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def to_dict(self):
+        """
+            :return: The statistics, as a dictionary that could be saved as JSON
+        """
+        return {
+            'calls': self.calls,
+            'time': self.time,
+            'target_time': self.target_time,
+            'reads': self.reads,
+            'writes': self.writes,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'latency_us': {"<{}".format(bucket): self.histogram[bucket]
+                           for bucket in sorted(self.histogram)},
+        }
+
+class TransactionStats:
+    """
+        Statistics of the target accesses, per command
+
+        Accesses are attributed to the innermost command being executed,
+        e.g. 'peripheral UART0 read CTRL' is attributed to 'read'.
+        The command being executed is tracked per thread, so the accesses
+        of a background thread (e.g. a register log) are never attributed
+        to the foreground command.
+    """
+    def __init__(self):
+        self.commands = {}
+        self.local = threading.local()
+
+    @property
+    def command(self):
+        """
+            The name of the command executed by the current thread, or None
+        """
+        return getattr(self.local, 'command', None)
+
+    @command.setter
+    def command(self, command):
+        self.local.command = command
+
+    def get(self, command):
+        """
+            :param command: The name of the command
+            :return: The CommandStats of the command
+        """
+        stats = self.commands.get(command)
+        if stats is None:
+            stats = self.commands[command] = CommandStats()
+        return stats
+
+    @contextmanager
+    def measure(self, command):
+        """
+            Attribute the target accesses to a command, and measure its duration
+
+            :param command: The name of the command
+        """
+        previous = self.command
+        self.command = command or ''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.get(self.command)
+            stats.calls += 1
+            stats.time += time.perf_counter() - start
+            self.command = previous
+
+    def add_transaction(self, write, size, latency):
+        """
+            Account a target access to the current command
+
+            :param write: True for a write, False for a read
+            :param size: The number of bytes transferred
+            :param latency: The duration of the access, in seconds
+        """
+        self.get(self.command or '').add_transaction(write, size, latency)
+
+    def reset(self):
+        """
+            Drop all the statistics
+        """
+        self.commands = {}
+
+    def to_dict(self):
+        """
+            :return: The statistics of all commands, as a dictionary
+        """
+        return {command: self.commands[command].to_dict()
+                for command in sorted(self.commands)}
+
+class InstrumentedClient(ClientWrapper):
+    """
+        A regice client wrapper that accounts every target access
+
+        Several prompts could share the same regice instance, and so the same
+        client. An access is accounted to the TransactionStats of the prompt
+        executing a command in the current thread, or to the first
+        TransactionStats if none is.
+    """
+    def __init__(self, client, stats):
+        super(InstrumentedClient, self).__init__(client)
+        self.stats = [stats]
+
+    def add_stats(self, stats):
+        """
+            Account the accesses of another prompt
+
+            :param stats: The TransactionStats of the prompt
+        """
+        if stats not in self.stats:
+            self.stats.append(stats)
+
+    def add_transaction(self, write, size, latency):
+        for stats in self.stats:
+            if stats.command is not None:
+                stats.add_transaction(write, size, latency)
+                return
+        self.stats[0].add_transaction(write, size, latency)
+
+    def read(self, width, address):
+        start = time.perf_counter()
+        value = self.client.read(width, address)
+        self.add_transaction(False, width // 8, time.perf_counter() - start)
+        return value
+
+    def write(self, width, address, value):
+        start = time.perf_counter()
+        self.client.write(width, address, value)
+        self.add_transaction(True, width // 8, time.perf_counter() - start)
+
+    def _read_burst(self, width, address, count):
+        start = time.perf_counter()
+        values = self.client.read_burst(width, address, count)
+        self.add_transaction(False, count * width // 8,
+                             time.perf_counter() - start)
+        return values
+
+    def _write_burst(self, width, address, values):
+        start = time.perf_counter()
+        self.client.write_burst(width, address, values)
+        self.add_transaction(True, len(values) * width // 8,
+                             time.perf_counter() - start)
+
+def get_instrumented_client(client):
+    """
+        Find the InstrumentedClient among the wrappers of a client
+
+        :param client: The regice client, possibly wrapped
+        :return: The InstrumentedClient, or None
+    """
+    while client is not None:
+        if isinstance(client, InstrumentedClient):
+            return client
+        client = getattr(client, '__dict__', {}).get('client')
+    return None
+
+def wrap_client(regice, wrapper):
+    """
+        Replace the client of regice by a wrapper
+
+        If regice is created on first use (see DeferredRegice), the client
+        is wrapped once regice has been created.
+
+        :param regice: The regice instance, or a DeferredRegice
+        :param wrapper: A function that takes the client, and returns
+                        the wrapper client
+    """
+    wrap = lambda regice: setattr(regice, 'client', wrapper(regice.client))
+    if hasattr(type(regice), 'add_init_hook'):
+        regice.add_init_hook(wrap)
+    else:
+        wrap(regice)
+
+def instrument(regice, stats):
+    """
+        Wrap the client of regice with an InstrumentedClient
+
+        If the client is already instrumented (e.g. by another prompt using
+        the same regice instance), stats is added to it instead.
+
+        :param regice: The regice instance, or a DeferredRegice
+        :param stats: The TransactionStats to update
+    """
+    def wrapper(client):
+        instrumented = get_instrumented_client(client)
+        if instrumented is None:
+            return InstrumentedClient(client, stats)
+        instrumented.add_stats(stats)
+        return client
+    wrap_client(regice, wrapper)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import struct
+import sys
+import threading
+import time
+from array import array
+
+from memtool.burst import plan_bursts, read_burst
+from memtool.wrapper import ClientWrapper
+
+LOG_MAGIC = b'MTLOG001'
+
+class LockedClient(ClientWrapper):
+    """
+        A regice client wrapper that serializes the target accesses
+
+        This lets a background thread share the target with the foreground
+        commands. The lock is only held during a single access, so a long
+        command never delays the background thread by more than one access.
+    """
+    def __init__(self, client, lock):
+        super(LockedClient, self).__init__(client)
+        self.lock = lock
+
+    def read(self, width, address):
+        with self.lock:
+            return self.client.read(width, address)
+
+    def write(self, width, address, value):
+        with self.lock:
+            self.client.write(width, address, value)
+
+    def _read_burst(self, width, address, count):
+        with self.lock:
+            return self.client.read_burst(width, address, count)
+
+    def _write_burst(self, width, address, values):
+        with self.lock:
+            self.client.write_burst(width, address, values)
+
+class LogWriter:
+    """
+        An append-only, column oriented log of register values
+
+        The file starts with a magic, and a JSON header (preceded by its
+        length) describing the columns. Samples are then written as blocks:
+        the number of samples, the timestamps of the samples (64 bits floats),
+        then the values of each column (64 bits integers), little endian.
+        Only one block is kept in memory.
+
+        Columns are a list of tuple (name, address, size). If the file
+        already exists, samples are appended to it, and it must have the
+        same columns.
+    """
+    def __init__(self, path, columns, period):
+        self.columns = [list(column) for column in columns]
+        header = json.dumps({'columns': self.columns, 'period': period}).encode()
+        try:
+            self.file = open(path, 'ab')
+            if self.file.tell() == 0:
+                self.file.write(LOG_MAGIC)
+                self.file.write(struct.pack('<I', len(header)))
+                self.file.write(header)
+            elif read_log_header(path)[0]['columns'] != self.columns:
+                self.file.close()
+                raise SyntaxWarning("Log file {} has different registers".format(path))
+        except OSError as ex:
+            raise SyntaxWarning("Failed to open log file: {}".format(ex))
+        self.timestamps = array('d')
+        self.values = [array('Q') for _column in self.columns]
+        self.count = 0
+
+    def add(self, timestamp, values):
+        """
+            Add a sample
+
+            :param timestamp: The time of the sample, in seconds since the epoch
+            :param values: The value of each column
+        """
+        self.timestamps.append(timestamp)
+        for column, value in zip(self.values, values):
+            column.append(value)
+        self.count += 1
+
+    def flush(self):
+        """
+            Write the pending samples as a block
+        """
+        if not self.timestamps:
+            return
+        self.file.write(struct.pack('<I', len(self.timestamps)))
+        for column in [self.timestamps] + self.values:
+            if sys.byteorder != 'little':
+                column.byteswap()
+            column.tofile(self.file)
+            del column[:]
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+def read_log_header(path):
+    """
+        Read the header of a log file
+
+        :param path: The path of the log file
+        :return: A tuple with the header, as a dictionary, and the offset
+                 of the first block
+    """
+    with open(path, 'rb') as log_file:
+        if log_file.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise SyntaxWarning("Invalid log file " + path)
+        length, = struct.unpack('<I', log_file.read(4))
+        header = json.loads(log_file.read(length).decode())
+    return header, len(LOG_MAGIC) + 4 + length
+
+def read_log(path):
+    """
+        Read all the samples of a log file
+
+        :param path: The path of the log file
+        :return: A tuple with the list of columns (name, address, size),
+                 the timestamps, and the list of the values of each column
+    """
+    header, offset = read_log_header(path)
+    timestamps = array('d')
+    values = [array('Q') for _column in header['columns']]
+    with open(path, 'rb') as log_file:
+        log_file.seek(offset)
+        while True:
+            data = log_file.read(4)
+            if len(data) < 4:
+                break
+            count, = struct.unpack('<I', data)
+            for column in [timestamps] + values:
+                block = array(column.typecode)
+                block.fromfile(log_file, count)
+                if sys.byteorder != 'little':
+                    block.byteswap()
+                column.extend(block)
+    return [tuple(column) for column in header['columns']], timestamps, values
+
+class RegisterLogger(threading.Thread):
+    """
+        A thread that periodically reads registers and logs them
+
+        Samples are taken on a fixed schedule: if a sample takes longer than
+        the period, the missed samples are skipped (and counted as overruns)
+        instead of delaying the next ones. Registers are read in bursts,
+        planned once, that never cover the hazards (registers with read
+        side effects). The client of regice must be safe to share between
+        threads (see LockedClient). The samples are written to the LogWriter
+        at least every flush_interval seconds. If stats is set, the accesses
+        of the thread are attributed to command in these TransactionStats.
+    """
+    def __init__(self, regice, registers, writer, period,
+                 flush_interval, gap, max_size, hazards=(),
+                 stats=None, command='log'):
+        super(RegisterLogger, self).__init__(daemon=True)
+        self.regice = regice
+        self.columns = {id(register): i for i, register in enumerate(registers)}
+        self.bursts = plan_bursts(registers, gap, max_size, hazards)
+        self.writer = writer
+        self.period = period
+        self.flush_interval = flush_interval
+        self.stopped = threading.Event()
+        self.overruns = 0
+        self.error = None
+        self.stats = stats
+        self.command = command
+
+    def sample(self):
+        """
+            Read all the registers once, and log them
+        """
+        timestamp = time.time()
+        values = [0] * len(self.columns)
+        client = self.regice.client
+        for burst in self.bursts:
+            for register, value in read_burst(client, burst):
+                values[self.columns[id(register)]] = value
+        self.writer.add(timestamp, values)
+
+    def run(self):
+        try:
+            if self.stats is None:
+                self.sample_loop()
+            else:
+                with self.stats.measure(self.command):
+                    self.sample_loop()
+        except Exception as ex:
+            self.error = ex
+        finally:
+            self.writer.close()
+
+    def sample_loop(self):
+        """
+            Take samples until the thread is stopped
+        """
+        start = time.perf_counter()
+        last_flush = start
+        tick = 0
+        while not self.stopped.is_set():
+            self.sample()
+            now = time.perf_counter()
+            if now - last_flush >= self.flush_interval:
+                self.writer.flush()
+                last_flush = now
+            next_tick = int((now - start) / self.period) + 1
+            self.overruns += next_tick - tick - 1
+            tick = next_tick
+            self.stopped.wait(start + tick * self.period - now)
+
+    def stop(self):
+        """
+            Stop the thread, and wait for the pending samples to be written
+        """
+        self.stopped.set()
+        self.join()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import sys
+from array import array
+
+TYPECODES = {8: 'B', 16: 'H', 32: 'I', 64: 'Q'}
+
+def read_memory(client, address, view, width):
+    """
+        Read a block of memory into a buffer
+
+        If the client supports block transfers (read_burst method), the whole
+        block is read at once. Otherwise, this falls back to one read per word.
+        Words are stored in the buffer in little endian order.
+
+        :param client: The regice client to use
+        :param address: The address of the block
+        :param view: A writable memoryview of bytes, its length must be
+                     a multiple of the word size
+        :param width: The size of a word, in bits
+    """
+    step = width // 8
+    count = len(view) // step
+    if hasattr(client, 'read_burst'):
+        words = client.read_burst(width, address, count)
+    else:
+        words = [client.read(width, address + i * step) for i in range(count)]
+    words = array(TYPECODES[width], words)
+    if sys.byteorder != 'little':
+        words.byteswap()
+    view.cast(TYPECODES[width])[:] = words
+
+def write_memory(client, address, view, width):
+    """
+        Write a buffer to a block of memory
+
+        If the client supports block transfers (write_burst method), the whole
+        block is written at once. Otherwise, this falls back to one write per word.
+
+        :param client: The regice client to use
+        :param address: The address of the block
+        :param view: A memoryview of bytes, its length must be a multiple
+                     of the word size. Words are in little endian order.
+        :param width: The size of a word, in bits
+    """
+    step = width // 8
+    words = array(TYPECODES[width], view.tobytes())
+    if sys.byteorder != 'little':
+        words.byteswap()
+    if hasattr(client, 'write_burst'):
+        client.write_burst(width, address, words)
+        return
+    for i, word in enumerate(words):
+        client.write(width, address + i * step, word)
+
+def hexdump(address, view, width):
+    """
+        Format a buffer as an hexdump, 16 bytes per line
+
+        :param address: The address of the first byte of the buffer
+        :param view: A memoryview of bytes, in little endian order
+        :param width: The size of a word, in bits
+        :return: A list of lines
+    """
+    step = width // 8
+    word_format = "0>{}x".format(step * 2)
+    words = array(TYPECODES[width], view.tobytes())
+    if sys.byteorder != 'little':
+        words.byteswap()
+    per_line = 16 // step
+    lines = []
+    for i in range(0, len(words), per_line):
+        data = view[i * step:(i + per_line) * step].tobytes()
+        text = ''.join(chr(byte) if 32 <= byte < 127 else '.' for byte in data)
+        lines.append("{}: {} |{}|".format(
+            format(address + i * step, "0>8x"),
+            ' '.join(format(word, word_format) for word in words[i:i + per_line]),
+            text))
+    return lines
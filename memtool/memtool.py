@@ -23,7 +23,25 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import sys
+import threading
+import time
+from array import array
 from cmd import Cmd
+from collections import OrderedDict, deque
+from heapq import merge
+
+from memtool.burst import WriteQueue, plan_bursts, read_burst
+from memtool.cache import ShadowCache
+from memtool.config import load_config, resolve_config
+from memtool.instrument import TransactionStats, instrument, wrap_client
+from memtool.logger import LockedClient, LogWriter, RegisterLogger
+from memtool.memory import TYPECODES, hexdump, read_memory, write_memory
+from memtool.output import OUTPUT_FORMATS
+from memtool.snapshot import Snapshot, get_snapshot_registers, take_snapshot
+from memtool.svdindex import build_device_index
+from memtool.targets import run_on_targets
+from memtool.trace import RecordingClient
 
 # pylint: disable=no-self-use
 class MemtoolPromptBase(Cmd):
@@ -34,50 +52,90 @@ class MemtoolPromptBase(Cmd):
         to handle exceptions and test.
     """
     test = False
+    strict = False
+    stats = None
+    def get_commands(self):
+        """
+            Get the commands of the prompt
+
+            The table is built once per class, so a command is dispatched
+            with a single dictionary lookup.
+
+            :return: A dictionary of do_* methods, indexed by command name
+        """
+        cls = type(self)
+        commands = cls.__dict__.get('_commands')
+        if commands is None:
+            commands = {name[3:]: getattr(cls, name)
+                        for name in dir(cls) if name.startswith('do_')}
+            cls._commands = commands
+        return commands
+
     def onecmd(self, str):
+        """
+            Interpret the command, and account its target accesses
+
+            :param str: The string to parse
+            :return: The value returned by execute()
+        """
+        if self.stats is None:
+            return self.execute(str)
+        command = str.strip().partition(' ')[0]
+        if command not in self.get_commands():
+            command = self.parseline(str)[0]
+        with self.stats.measure(command):
+            return self.execute(str)
+
+    def dispatch(self, str):
+        """
+            Call the method of a command
+
+            Lines starting with a command name followed by a space are
+            dispatched directly. Anything else (empty lines, '?', '!', unknown
+            commands...) goes through Cmd.onecmd().
+
+            :param str: The string to parse
+            :return: The value returned by the command
+        """
+        line = str.strip()
+        command, _sep, arg = line.partition(' ')
+        method = self.get_commands().get(command)
+        if method is None:
+            return super().onecmd(str)
+        self.lastcmd = line
+        return method(self, arg.strip())
+
+    def execute(self, str):
         """
             Interpret the command
 
             This is an overriden method that handle exceptions, to not
             stop the script even in the case of error.
             Exception handling could disabled for testing (to check if
-            exception have been raised).
+            exception have been raised), or when running a script (strict)
+            to stop on the first error.
 
             :param str: The string to parse
             :return: A tuple, where the first value is a boolean set to True
                      to exit cmdloop, and the second is data returned by the
                      function called by one cmd.
         """
-        if self.test:
-            return super().onecmd(str)
+        if self.test or self.strict:
+            return self.dispatch(str)
 
         try:
-            return super().onecmd(str)
+            return self.dispatch(str)
         except SyntaxWarning as ex:
             print(ex)
         return False, None
 
-    def postcmd(self, stop, _data):
+    def default(self, line):
         """
-            postcmd method updated to work with the overriden onecmd() method
+            Called on an unknown command
 
-            :param stop: Set to True if cmdloop() must stop
-            :param data: data returned by onecmd() method
-            :return: True if cmdloop() must stop
+            :param line: The command line
         """
-        if stop is None:
-            return False
-        return stop[0]
-
-class MemtoolPeripheralPrompt(MemtoolPromptBase):
-    """
-        A class to handle peripheral commands
-    """
-    def __init__(self, memtool_prompt, peripheral):
-        super(MemtoolPeripheralPrompt, self).__init__()
-        self.regice = memtool_prompt.regice
-        self.test = memtool_prompt.test
-        self.peripheral = peripheral
+        raise SyntaxWarning("Unknown command: " + line)
 
     def get_args(self, line):
         """
@@ -117,6 +175,95 @@ class MemtoolPeripheralPrompt(MemtoolPromptBase):
             return True, args[1:]
         return False, args
 
+    def test_first_option(self, args, option, default, convert=None):
+        """
+            This tests if the first argument is an option expecting a value
+
+            This tests if the first argument in the list is equal to option.
+            If so, this parses the value that follows it, and remove both
+            from the argument list.
+
+            :param args: A list of argument
+            :param option: The name of the option, e.g. '-g'
+            :param default: The value to return if the option is not set
+            :param convert: A function to convert the value,
+                            by default the value is parsed as an integer
+            :return: A tuple, with the value of the option (or default),
+                     and the list of remaining arguments
+        """
+        found, args = self.test_first_arg(args, option)
+        if not found:
+            return default, args
+        if convert is None:
+            convert = lambda value: int(value, 0)
+        try:
+            return convert(args[0]), args[1:]
+        except (IndexError, ValueError):
+            raise SyntaxWarning("Invalid value for option {}".format(option))
+
+    def get_options(self, args, flags=(), options=None):
+        """
+            Parse the options at the beginning of an argument list
+
+            Options could be given in any order, up to the first argument
+            that is not an option.
+
+            :param args: A list of argument
+            :param flags: The options without value, e.g. ('-v',)
+            :param options: A dictionary of the options expecting a value,
+                            with a tuple (default, convert) for each of them,
+                            see test_first_option()
+            :return: A tuple, with a dictionary of the value of each option
+                     (True or False for flags), and the list of remaining
+                     arguments
+        """
+        options = options or {}
+        values = {flag: False for flag in flags}
+        for option, (default, _convert) in options.items():
+            values[option] = default
+        while args and (args[0] in flags or args[0] in options):
+            option = args[0]
+            if option in flags:
+                values[option] = True
+                args = args[1:]
+            else:
+                values[option], args = self.test_first_option(
+                    args, option, options[option][0], options[option][1])
+        return values, args
+
+    def postcmd(self, stop, _data):
+        """
+            postcmd method updated to work with the overriden onecmd() method
+
+            :param stop: Set to True if cmdloop() must stop
+            :param data: data returned by onecmd() method
+            :return: True if cmdloop() must stop
+        """
+        if stop is None:
+            return False
+        return stop[0]
+
+class MemtoolPeripheralPrompt(MemtoolPromptBase):
+    """
+        A class to handle peripheral commands
+    """
+    conditions = {
+        '==': lambda value, expected: value == expected,
+        '!=': lambda value, expected: value != expected,
+        '&': lambda value, expected: bool(value & expected),
+    }
+
+    def __init__(self, memtool_prompt, peripheral):
+        super(MemtoolPeripheralPrompt, self).__init__()
+        self.memtool_prompt = memtool_prompt
+        self.regice = memtool_prompt.regice
+        self.test = memtool_prompt.test
+        self.strict = memtool_prompt.strict
+        self.stats = memtool_prompt.stats
+        self.peripheral = peripheral
+        self.index = memtool_prompt.get_index(peripheral)
+        self.cache = memtool_prompt.cache
+
     def test_and_get_register(self, arg):
         """
             Test if a register exists, and if so, returns its name
@@ -125,7 +272,7 @@ class MemtoolPeripheralPrompt(MemtoolPromptBase):
             :return: The register if it exists, otherwise raise an exception
         """
         register = arg.split('.')[0]
-        if not self.regice.register_exist(self.peripheral, register):
+        if register not in self.index.registers:
             raise SyntaxWarning("Invalid register name")
         return register
 
@@ -140,11 +287,30 @@ class MemtoolPeripheralPrompt(MemtoolPromptBase):
         register = args[0]
         if len(args) == 2:
             field = args[1]
-            if not self.regice.field_exist(self.peripheral, register, field):
+            if field not in self.index.registers[register].fields:
                 raise SyntaxWarning("Invalid field name")
             return args[1]
         return None
 
+    def complete_register(self, text, line, begidx, _endidx):
+        """
+            Complete a register or a register '.' field name
+
+            Options (arguments starting by '-') are not completed.
+
+            :param text: The text to complete
+            :return: A list of names starting by text
+        """
+        if text.startswith('-'):
+            return []
+        return self.index.complete(text)
+
+    complete_read = complete_register
+    complete_write = complete_register
+    complete_dump = complete_register
+    complete_watch = complete_register
+    complete_waitfor = complete_register
+
     def do_return(self, _arg):
         """
             Return from MemtoolPeripheralPrompt to MemtoolPrompt
@@ -161,61 +327,139 @@ class MemtoolPeripheralPrompt(MemtoolPromptBase):
         """
             Read the content of a register or the value of one of its field
 
-            The commnd is read [-v] <register[.field]>, with:
+            The commnd is read [-f format] [-v] <register[.field]>, with:
+            - format: the output format (text, jsonl, csv or bin),
+                      by default the one set with the format command
             - register: the name of register
             - field: the name of field to ger
             If '-v' argument is set, then read will display all register's fields
 
+            The register is read once, and fields are decoded from its value.
+
             :param arg: read command arguments
             :return: False, and the value read from register
         """
         args = self.get_args(arg)
-        verbose, args = self.test_first_arg(args, "-v")
+        options, args = self.get_options(args, ("-v",), {"-f": (None, str)})
+        output = self.memtool_prompt.get_output(options["-f"])
+        verbose = options["-v"]
         if not args:
-            raise SyntaxWarning("Expected format is 'read [-v] <register[.field]>'")
+            raise SyntaxWarning("Expected format is 'read [-f format] [-v] <register[.field]>'")
         register = self.test_and_get_register(args[0])
-        size = self.regice.get_size(self.peripheral, register)
-        read_format = "0>{}x".format(size)
-        if not verbose:
-            field = self.test_and_get_field(args[0])
-            if not field:
-                value = self.regice.read(self.peripheral, register)
-                print("{} = 0x{}".format(register, format(value, read_format)))
+        info = self.index.registers[register]
+        value = self.read_register(info)
+        try:
+            if not verbose:
+                field = self.test_and_get_field(args[0])
+                if field:
+                    value = info.fields[field].decode(value)
+                output.emit(self.peripheral, args[0], info, value, field)
             else:
-                value = self.regice.read_fields(self.peripheral, register)[field]
-                print("{} = 0x{}".format(args[0], format(value, read_format)))
-        else:
-            value = fields = self.regice.read_fields(self.peripheral, register)
-            print(register + ":")
-            for field in fields:
-                print(" {} = {}".format(field, fields[field]))
+                fields = info.decode(value)
+                output.emit(self.peripheral, register, info, value, fields=fields)
+                value = fields
+        finally:
+            output.flush()
         return False, value
 
+    def read_register(self, info, bypass=False):
+        """
+            Read a register, from the shadow cache if possible
+
+            :param info: The RegisterInfo of the register
+            :param bypass: Set to True to always read the register from the target
+            :return: The value of the register
+        """
+        batch = self.memtool_prompt.batch
+        if batch is not None and batch.get(self.peripheral, info) is not None:
+            return batch.get(self.peripheral, info)
+        value = None if bypass else self.cache.get(self.peripheral, info)
+        if value is None:
+            value = self.regice.read(self.peripheral, info.name)
+            self.cache.update(self.peripheral, info, value)
+        return value
+
+    def write_register(self, info, value):
+        """
+            Write a register, and update the shadow cache
+
+            Inside a batch, the write is only queued (see MemtoolPrompt.do_batch).
+
+            :param info: The RegisterInfo of the register
+            :param value: The value to write
+        """
+        if self.memtool_prompt.batch is not None:
+            self.memtool_prompt.batch.put(self.peripheral, info, value)
+            return
+        self.regice.write(self.peripheral, info.name, value)
+        self.cache.update(self.peripheral, info, value)
+
+    def read_registers(self, registers, gap, max_size, bypass=False):
+        """
+            Read a set of registers using as few transfers as possible
+
+            See MemtoolPrompt.read_registers().
+
+            :param registers: A list of RegisterInfo to read
+            :param gap: The maximum number of bytes between two registers
+                        read in the same burst
+            :param max_size: The maximum size of a burst, in bytes
+            :param bypass: Set to True to always read the registers from the target
+            :return: A generator of tuple (RegisterInfo, value),
+                     sorted by address
+        """
+        registers = [(self.peripheral, register) for register in registers]
+        for _peripheral, register, value in self.memtool_prompt.read_registers(
+                registers, gap, max_size, bypass):
+            yield register, value
+
     def do_write(self, arg):
         """
             Write a value to a register or one of its fiels
 
-            The command is write <register[.field]> <value> with:
+            The command is write [-V] <register[.field]> <value> with:
             - register: the name of register to write
             - field: the name of the field to set
             - value: the value to write
+            If '-V' argument is set, then the register is read back and displayed.
+
+            A field write is done with a single read-modify-write.
+            The read is skipped if the register is write-only, if the field
+            covers the whole register, or if the register is in the shadow cache.
 
             :param arg: write command arguments
-            :return: False, and the value read back from register
+            :return: False, and the value written (or read back if '-V' is set)
         """
         args = self.get_args(arg)
+        verify, args = self.test_first_arg(args, "-V")
         if len(args) < 2 or not args[0] or not args[1]:
-            raise SyntaxWarning("Expected format is 'write <register[.field]> <value>'")
+            raise SyntaxWarning("Expected format is 'write [-V] <register[.field]> <value>'")
         register = self.test_and_get_register(args[0])
         field = self.test_and_get_field(args[0])
+        try:
+            value = int(args[1], 0)
+        except ValueError:
+            try:
+                value = int(args[1])
+            except ValueError:
+                raise SyntaxWarning("Invalid value " + args[1])
+        info = self.index.registers[register]
         if not field:
-            self.regice.write(self.peripheral, register, int(args[1]))
+            if value < 0 or value >> info.size:
+                raise SyntaxWarning("Value too large for register " + register)
+            self.write_register(info, value)
         else:
-            fields = self.regice.read_fields(self.peripheral, register)
-            fields[field] = args[1]
-            self.regice.write_fields(self.peripheral, register, fields)
+            field = info.fields[field]
+            if info.is_write_only() or info.owns(field):
+                current = 0
+            else:
+                current = self.read_register(info)
+            self.write_register(info, info.merge(current, field, value))
 
-        return self.do_read(args[0])
+        if verify:
+            self.cache.invalidate(self.peripheral, info)
+            return self.do_read(args[0])
+        return False, value
 
     def do_baseAddress(self, _arg):
         """
@@ -224,7 +468,7 @@ class MemtoolPeripheralPrompt(MemtoolPromptBase):
             :param arg: Unused
             :return: False, and the base address of peripheral
         """
-        address = self.regice.get_base_address(self.peripheral)
+        address = self.index.base_address
         print("0x" + format(address, "0>8x"))
         return False, address
 
@@ -232,54 +476,1231 @@ class MemtoolPeripheralPrompt(MemtoolPromptBase):
         """
             Read the value of some or all peripheral's register
 
-            The command is dump [-v] [register [register [...]]], with:
+            The command is dump [-f format] [-v] [-g gap] [-m max]
+            [register [register [...]]], with:
+            - format: the output format (text, jsonl, csv or bin),
+                      by default the one set with the format command
+            - gap: the maximum number of bytes between two registers
+                   read in the same burst
+            - max: the maximum size of a burst, in bytes
             - register: the name of register
             If '-v' argument is set, then it will display all registers's fields.
             If there is no register in argument list, then display all registers.
 
+            Registers are read by address order, and adjacent registers are
+            merged into block transfers. Registers with read side effects are
+            never part of a burst, and are always read alone.
+            Fields are decoded from the values read, without any other access.
+            Registers are written to the output as soon as they are read.
+
             :param arg: dump command arguments
             :return: False, and the value read from register
 
         """
         values = {}
         args = self.get_args(arg)
-        verbose, args = self.test_first_arg(args, "-v")
-        if not args:
-            registers_name = []
-        else:
-            registers_name = args
-        for register in registers_name:
-            if not self.regice.register_exist(self.peripheral, register):
+        options, args = self.get_options(args, ("-v",), {
+            "-f": (None, str),
+            "-g": (self.memtool_prompt.burst_gap, None),
+            "-m": (self.memtool_prompt.burst_max, None),
+        })
+        output = self.memtool_prompt.get_output(options["-f"])
+        verbose = options["-v"]
+        gap = options["-g"]
+        max_size = options["-m"]
+        registers = []
+        for register in dict.fromkeys(args):
+            if register not in self.index.registers:
                 raise SyntaxWarning("Invalid register name " + register)
-        registers = self.regice.get_register_list(self.peripheral, registers_name)
-        for register in registers:
-            if not verbose:
-                _exit, values[register] = self.do_read(register)
-            else:
-                _exit, values[register] = self.do_read("-v " + register)
+            registers.append(self.index.registers[register])
+        if not args:
+            registers = list(self.index.registers.values())
+        try:
+            for register, value in self.read_registers(registers, gap, max_size):
+                if not verbose:
+                    output.emit(self.peripheral, register.name, register, value)
+                else:
+                    fields = register.decode(value)
+                    output.emit(self.peripheral, register.name, register, value,
+                                fields=fields)
+                    value = fields
+                values[register.name] = value
+        finally:
+            output.flush()
         return False, values
 
+    def do_watch(self, arg):
+        """
+            Sample registers or fields, and display their transitions
+
+            The command is watch [-n count] [-i interval] [-o file]
+            <register[.field]> [register[.field] [...]], with:
+            - count: the number of samples, 0 (default) to sample until Ctrl-C.
+                     A count is required in strict mode (scripts and server).
+            - interval: the time to wait between two samples, in seconds
+            - file: a file where to save the samples kept in the ring buffer
+            The registers are sampled in a tight loop, using one burst per
+            sample when they are contiguous, and bypassing the shadow cache.
+            Only the changes are displayed, with a timestamp relative to the
+            first sample. The last samples are kept in a ring buffer of
+            MemtoolPrompt.watch_buffer entries.
+
+            :param arg: watch command arguments
+            :return: False, and the list of samples in the ring buffer,
+                     as tuples (timestamp, values)
+        """
+        args = self.get_args(arg)
+        options, args = self.get_options(args, options={
+            "-n": (0, None),
+            "-i": (0.0, float),
+            "-o": (None, str),
+        })
+        count = options["-n"]
+        interval = options["-i"]
+        output = options["-o"]
+        if not args:
+            raise SyntaxWarning("Expected format is 'watch [-n count] [-i interval] "
+                                "[-o file] <register[.field]> [...]'")
+        if count <= 0 and self.strict:
+            raise SyntaxWarning("Expected format is 'watch -n <count> [-i interval] "
+                                "[-o file] <register[.field]> [...]'")
+        watched = []
+        registers = {}
+        for name in args:
+            register = self.test_and_get_register(name)
+            field = self.test_and_get_field(name)
+            info = self.index.registers[register]
+            registers[register] = info
+            watched.append((name, info, info.fields[field] if field else None))
+
+        registers = list(registers.values())
+        gap = self.memtool_prompt.burst_gap
+        max_size = self.memtool_prompt.burst_max
+        buffer = deque(maxlen=self.memtool_prompt.watch_buffer)
+        previous = None
+        samples = 0
+        start = time.perf_counter()
+        try:
+            while not count or samples < count:
+                raw = {register.name: value for register, value in
+                       self.read_registers(registers, gap, max_size, bypass=True)}
+                timestamp = time.perf_counter() - start
+                values = tuple(field.decode(raw[info.name]) if field else raw[info.name]
+                               for _name, info, field in watched)
+                buffer.append((timestamp, values))
+                samples += 1
+                for i, (name, info, _field) in enumerate(watched):
+                    if previous is None or previous[i] != values[i]:
+                        print("{:.6f} {} = 0x{}".format(
+                            timestamp, name, format(values[i], info.read_format)))
+                previous = values
+                if interval:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        elapsed = time.perf_counter() - start
+        print("{} samples in {:.3f}s ({:.1f} samples/s)".format(
+            samples, elapsed, samples / elapsed if elapsed else 0))
+
+        if output:
+            with open(output, 'w') as samples_file:
+                samples_file.write(",".join(["time"] + args) + "\n")
+                for timestamp, values in buffer:
+                    samples_file.write(",".join(
+                        ["{:.6f}".format(timestamp)] + [hex(value) for value in values]) + "\n")
+        return False, list(buffer)
+
+    def do_waitfor(self, arg):
+        """
+            Wait until a register or field matches a condition
+
+            The command is waitfor <register[.field]> <==|!=|&> <value>
+            [--timeout seconds], with:
+            - register: the name of register
+            - field: the name of field to test
+            - value: the value to compare with. '&' waits until at least one
+                     of the bits of value is set.
+            The register is first read back to back, and then with an
+            exponential backoff, to not saturate the debug link during long
+            waits. The shadow cache is bypassed.
+
+            :param arg: waitfor command arguments
+            :return: False, and the last value read
+        """
+        args = self.get_args(arg)
+        timeout = self.memtool_prompt.waitfor_timeout
+        if len(args) == 5 and args[3] == '--timeout':
+            try:
+                timeout = float(args[4])
+            except ValueError:
+                raise SyntaxWarning("Invalid timeout " + args[4])
+            args = args[:3]
+        if len(args) != 3 or args[1] not in self.conditions:
+            raise SyntaxWarning("Expected format is 'waitfor <register[.field]> "
+                                "<==|!=|&> <value> [--timeout seconds]'")
+        register = self.test_and_get_register(args[0])
+        field = self.test_and_get_field(args[0])
+        try:
+            expected = int(args[2], 0)
+        except ValueError:
+            raise SyntaxWarning("Invalid value " + args[2])
+        info = self.index.registers[register]
+        field = info.fields[field] if field else None
+        condition = self.conditions[args[1]]
+
+        reads = 0
+        delay = self.memtool_prompt.waitfor_delay
+        start = time.perf_counter()
+        deadline = start + timeout
+        while True:
+            value = self.read_register(info, bypass=True)
+            if field:
+                value = field.decode(value)
+            reads += 1
+            now = time.perf_counter()
+            if condition(value, expected):
+                break
+            if now >= deadline:
+                raise SyntaxWarning("Timeout waiting for {} {} {} (last value 0x{})".format(
+                    args[0], args[1], args[2], format(value, info.read_format)))
+            if reads > self.memtool_prompt.waitfor_spin:
+                time.sleep(min(delay, deadline - now))
+                delay = min(delay * 2, self.memtool_prompt.waitfor_max_delay)
+        print("{} = 0x{} after {} reads in {:.6f}s".format(
+            args[0], format(value, info.read_format), reads, now - start))
+        return False, value
+
 class MemtoolPrompt(MemtoolPromptBase):
     """
         A class to handle regice commands
     """
-    def __init__(self, regice):
+    burst_gap = 16
+    burst_max = 1024
+    watch_buffer = 4096
+    memory_chunk = 64 * 1024
+    waitfor_timeout = 10.0
+    waitfor_spin = 16
+    waitfor_delay = 0.0001
+    waitfor_max_delay = 0.1
+    sessions_max = 64
+    log_flush_interval = 1.0
+
+    def __init__(self, regice, index=None):
         super(MemtoolPrompt, self).__init__()
         self.regice = regice
+        if index is None:
+            index = build_device_index(regice)
+        self.index = index
+        self.cache = ShadowCache()
+        self.batch = None
+        self.snapshot_registers = None
+        self.stats = TransactionStats()
+        instrument(regice, self.stats)
+        self.trace = None
+        self.targets = {'default': self}
+        self.selected = self
+        self.target_factory = None
+        self.output_format = 'text'
+        self.outputs = {}
+        self.sessions = OrderedDict()
+        self.client_lock = None
+        self.logs = {}
+
+    def onecmd(self, str, local=False):
+        """
+            Interpret the command on the selected target
+
+            The 'target' commands, and the commands prefixed by '@'
+            (see default()), always run on this prompt.
+
+            :param str: The string to parse
+            :param local: Set to True to run the command on this prompt,
+                          whatever the selected target
+            :return: The value returned by the command
+        """
+        target = self.selected
+        if (not local and target is not self and
+                not str.lstrip().startswith(('target', '@'))):
+            target.test = self.test
+            target.strict = self.strict
+            return target.onecmd(str)
+        return super(MemtoolPrompt, self).onecmd(str)
+
+    def default(self, line):
+        """
+            Called on an unknown command, or on a command prefixed by '@'
+
+            '@all <command>' runs the command on all the targets, and
+            '@t1,t2 <command>' runs it on the targets t1 and t2. Targets run
+            the command concurrently. The output of each target is displayed
+            once all of them are done.
+
+            :param line: The command line
+            :return: False, and a dictionary with the data returned by the
+                     command, indexed by target name
+        """
+        if not line.startswith('@'):
+            return super(MemtoolPrompt, self).default(line)
+        names, _sep, command = line[1:].partition(' ')
+        if not command.strip():
+            raise SyntaxWarning("Expected format is '@all|@<target>[,<target>...] <command>'")
+        if names == 'all':
+            names = list(self.targets)
+        else:
+            names = names.split(',')
+        for name in names:
+            if name not in self.targets:
+                raise SyntaxWarning("Invalid target " + name)
+
+        results = run_on_targets({name: self.targets[name] for name in names}, command)
+        values = {}
+        errors = []
+        for name in names:
+            error, data, text = results[name]
+            for text_line in text.splitlines():
+                print("[{}] {}".format(name, text_line))
+            if error is not None:
+                print("[{}] error: {}".format(name, error))
+                errors.append(name)
+            values[name] = data
+        if errors:
+            raise SyntaxWarning("Command failed on " + ",".join(errors))
+        return False, values
+
+    def read_registers(self, registers, gap, max_size, bypass=False):
+        """
+            Read a set of registers using as few transfers as possible
+
+            Registers are sorted by address and merged into bursts, even across
+            peripherals. Registers with read side effects are never part of
+            a burst. Registers found in the shadow cache are not read at all,
+            unless bypass is set.
+
+            :param registers: A list of tuple (peripheral, RegisterInfo) to read
+            :param gap: The maximum number of bytes between two registers
+                        read in the same burst
+            :param max_size: The maximum size of a burst, in bytes
+            :param bypass: Set to True to always read the registers from the target
+            :return: A generator of tuple (peripheral, RegisterInfo, value),
+                     sorted by address
+        """
+        cached = []
+        missing = []
+        owners = {}
+        for peripheral, register in registers:
+            value = None if bypass else self.cache.get(peripheral, register)
+            if value is None:
+                missing.append(register)
+                owners[id(register)] = peripheral
+            else:
+                cached.append((peripheral, register, value))
+        cached.sort(key=lambda item: item[1].address)
+        hazards = []
+        for peripheral in set(owners.values()):
+            hazards.extend(self.index.get_peripheral(peripheral).get_side_effect_registers())
+        for item in merge(cached, self.read_bursts(missing, owners, gap, max_size, hazards),
+                          key=lambda item: item[1].address):
+            yield item
+
+    def read_bursts(self, registers, owners, gap, max_size, hazards):
+        """
+            Read a set of registers from the target, and update the shadow cache
+
+            :param registers: A list of RegisterInfo to read
+            :param owners: The peripheral of each register, indexed by id(register)
+            :param gap: The maximum number of bytes between two registers
+                        read in the same burst
+            :param max_size: The maximum size of a burst, in bytes
+            :param hazards: Registers that must never be read as part of a burst
+            :return: A generator of tuple (peripheral, RegisterInfo, value),
+                     sorted by address
+        """
+        for burst in plan_bursts(registers, gap, max_size, hazards):
+            for register, value in read_burst(self.regice.client, burst):
+                peripheral = owners[id(register)]
+                self.cache.update(peripheral, register, value)
+                yield peripheral, register, value
+
+    def get_selection(self, args, fields, regex=False):
+        """
+            Resolve the selectors of a dump or read command
+
+            :param args: The arguments, starting with the optional -r option
+            :param fields: Set to False to only accept register selectors
+            :param regex: Set to True if selectors are regex, as with -r
+            :return: A list of tuple (name, peripheral, RegisterInfo,
+                     field name or None), sorted by address, without duplicates
+        """
+        found, args = self.test_first_arg(args, "-r")
+        regex = regex or found
+        if not args:
+            return []
+        selection = {}
+        for selector in args:
+            matches = self.index.select(selector.strip("'\""), regex, fields)
+            if not matches:
+                raise SyntaxWarning("No register matches " + selector)
+            for match in matches:
+                selection[match[0]] = match
+        return sorted(selection.values(), key=lambda match: match[2].address)
+
+    def read_selection(self, selection, output, verbose):
+        """
+            Read the registers of a selection, and write them to the output
+
+            The selection is grouped by register, so each register is read
+            once, and written to the output as soon as it is read.
+
+            :param selection: A list returned by get_selection()
+            :param output: The RegisterOutput to use
+            :param verbose: Set to True to write the fields of the registers
+            :return: A dictionary with the values read, indexed by name
+        """
+        registers = {}
+        selected = {}
+        for item in selection:
+            _name, peripheral, info, _field = item
+            if id(info) not in selected:
+                registers[id(info)] = (peripheral, info)
+                selected[id(info)] = []
+            selected[id(info)].append(item)
+        values = {}
+        try:
+            for _peripheral, info, raw in self.read_registers(
+                    list(registers.values()), self.burst_gap, self.burst_max):
+                for name, peripheral, info, field in selected.pop(id(info)):
+                    value = raw
+                    if field is not None:
+                        value = info.fields[field].decode(raw)
+                        output.emit(peripheral, name, info, value, field)
+                    elif verbose:
+                        value = info.decode(raw)
+                        output.emit(peripheral, name, info, raw, fields=value)
+                    else:
+                        output.emit(peripheral, name, info, raw)
+                    values[name] = value
+        finally:
+            output.flush()
+        return values
+
+    def do_dump(self, arg):
+        """
+            Read the registers matching selectors, across peripherals
+
+            The command is dump [-f format] [-v] [-r] <selector> [selector [...]],
+            with:
+            - format: the output format (text, jsonl, csv or bin)
+            - selector: a glob, peripheral[.register], e.g. 'UART*.*CTRL*'
+            If '-r' argument is set, selectors are regex matched against
+            peripheral.register names, e.g. 'DMA[0-7]\\.CH.*'.
+            If '-v' argument is set, then it will display all registers's fields.
+            Selectors are resolved with the device name index, and the
+            matching registers are read in address order, with merged transfers.
+
+            :param arg: dump command arguments
+            :return: False, and a dictionary with the values read,
+                     indexed by peripheral.register
+        """
+        args = self.get_args(arg)
+        options, args = self.get_options(args, ("-v", "-r"), {"-f": (None, str)})
+        output = self.get_output(options["-f"])
+        selection = self.get_selection(args, False, options["-r"])
+        if not selection:
+            raise SyntaxWarning("Expected format is 'dump [-f format] [-v] [-r] "
+                                "<selector> [selector [...]]'")
+        return False, self.read_selection(selection, output, options["-v"])
+
+    def do_read(self, arg):
+        """
+            Read the registers or fields matching selectors, across peripherals
+
+            The command is read [-f format] [-r] <selector> [selector [...]], with:
+            - format: the output format (text, jsonl, csv or bin)
+            - selector: a glob, peripheral.register[.field], e.g. '*.STATUS.ERR'
+            If '-r' argument is set, selectors are regex matched against
+            peripheral.register and peripheral.register.field names.
+            Each register is read once, even if several of its fields match.
+
+            :param arg: read command arguments
+            :return: False, and a dictionary with the values read,
+                     indexed by name
+        """
+        args = self.get_args(arg)
+        options, args = self.get_options(args, ("-r",), {"-f": (None, str)})
+        output = self.get_output(options["-f"])
+        selection = self.get_selection(args, True, options["-r"])
+        if not selection:
+            raise SyntaxWarning("Expected format is 'read [-f format] [-r] "
+                                "<selector> [selector [...]]'")
+        return False, self.read_selection(selection, output, False)
+
+    def get_output(self, output_format=None):
+        """
+            Get the writer of an output format
+
+            Writers are kept for the whole session, so a CSV header is only
+            written once.
+
+            :param output_format: The name of the format, or None to use
+                                  the format set with the format command
+            :return: A RegisterOutput
+        """
+        if output_format is None:
+            output_format = self.output_format
+        if output_format not in OUTPUT_FORMATS:
+            raise SyntaxWarning("Invalid output format " + output_format)
+        if output_format not in self.outputs:
+            self.outputs[output_format] = OUTPUT_FORMATS[output_format]()
+        return self.outputs[output_format]
+
+    def do_format(self, arg):
+        """
+            Set the output format of the register values
+
+            The command is format [text|jsonl|csv|bin]. Without argument,
+            this displays the current format.
+            The format is used by the read and dump commands, unless they
+            are given the -f option.
+
+            :param arg: format command arguments
+            :return: False, and the output format
+        """
+        if not arg:
+            print(self.output_format)
+        elif arg in OUTPUT_FORMATS:
+            self.output_format = arg
+        else:
+            raise SyntaxWarning("Expected format is 'format [{}]'".format(
+                "|".join(OUTPUT_FORMATS)))
+        return False, self.output_format
+
+    def add_target(self, name, regice, index=None):
+        """
+            Add a target to the session
+
+            :param name: The name of the target
+            :param regice: The regice instance connected to the target
+            :param index: The DeviceIndex of the target. By default, the target
+                          is expected to use the same SVD as this prompt.
+            :return: The MemtoolPrompt of the target
+        """
+        if name in self.targets or name.startswith('@') or ',' in name:
+            raise SyntaxWarning("Invalid target name " + name)
+        target = MemtoolPrompt(regice, self.index if index is None else index)
+        target.output_format = self.output_format
+        if self.trace is not None:
+            target.record(self.trace)
+        self.targets[name] = target
+        return target
+
+    def record(self, trace):
+        """
+            Log all the target accesses to a trace
+
+            Targets added later are recorded to the same trace.
+
+            :param trace: The TraceWriter to append the accesses to
+        """
+        self.trace = trace
+        wrap_client(self.regice,
+                    lambda client: RecordingClient(client, trace, self.stats))
+
+    def do_target(self, arg):
+        """
+            Manage the targets of the session
+
+            The command is target add|list|select, with:
+            - add <name> <arguments>: connect to a new target, using the same
+              arguments as memtool (e.g. --svd)
+            - list: list the targets, the selected one is marked with '*'
+            - select <name>: run the next commands on the target
+            The target of the initial connection is named 'default'.
+
+            :param arg: target command arguments
+            :return: False, and the list of targets for the list command
+        """
+        args = arg.split()
+        if len(args) >= 2 and args[0] == 'add':
+            if self.target_factory is None:
+                raise SyntaxWarning("Adding targets is not supported")
+            regice, index = self.target_factory(args[2:])
+            self.add_target(args[1], regice, index)
+            return False, None
+        if args == ['list']:
+            for name in self.targets:
+                marker = '*' if self.targets[name] is self.selected else ' '
+                print("{} {}".format(marker, name))
+            return False, list(self.targets)
+        if len(args) == 2 and args[0] == 'select':
+            if args[1] not in self.targets:
+                raise SyntaxWarning("Invalid target " + args[1])
+            self.selected = self.targets[args[1]]
+            self.prompt = 'Memtool[{}]> '.format(args[1])
+            return False, None
+        raise SyntaxWarning("Expected format is 'target add <name> <arguments>|"
+                            "list|select <name>'")
+
+    def get_index(self, peripheral):
+        """
+            Get the register index of a peripheral
+
+            :param peripheral: The name of the peripheral
+            :return: The PeripheralIndex of the peripheral
+        """
+        return self.index.get_peripheral(peripheral)
 
     def do_peripherals(self, arg):
         """
             Execute peripherals commands
 
-            Command is peripherals list, which lists all the peripherals.
+            Command is peripherals list [-v], which lists all the peripherals.
+            If '-v' argument is set, then it also displays the base address
+            and the number of registers of each peripheral.
             :param arg: peripherals command arguments
             :return: False, and the list of peripherals
         """
-        if not arg or not arg == "list":
-            raise SyntaxWarning("Expected format is 'peripherals list'")
-        for peripheral in self.regice.get_peripheral_list():
-            print(peripheral)
-        return False, self.regice.get_peripheral_list()
+        args = arg.split()
+        if not args or args[0] != "list" or args[1:] not in ([], ["-v"]):
+            raise SyntaxWarning("Expected format is 'peripherals list [-v]'")
+        peripherals = self.index.get_peripheral_list()
+        for peripheral in peripherals:
+            if len(args) == 1:
+                print(peripheral)
+                continue
+            index = self.index.get_peripheral(peripheral)
+            print("{} 0x{} {} registers".format(
+                peripheral, format(index.base_address, "0>8x"),
+                len(index.registers)))
+        return False, peripherals
+
+    def do_cache(self, arg):
+        """
+            Control the shadow register cache
+
+            The command is cache on|off|flush [peripheral]|stats [reset], with:
+            - on: enable the cache
+            - off: disable and flush the cache
+            - flush: drop the cached values of one or all peripherals
+            - stats: display cache hits, misses and bypasses
+            Volatile registers (status, read side effects, write-1-to-clear, ...)
+            always bypass the cache.
+
+            :param arg: cache command arguments
+            :return: False, and the cache stats for the 'stats' command
+        """
+        args = arg.split()
+        if not args or args[0] not in ('on', 'off', 'flush', 'stats'):
+            raise SyntaxWarning("Expected format is 'cache on|off|flush [peripheral]|stats [reset]'")
+        if args[0] == 'on':
+            self.cache.enabled = True
+        elif args[0] == 'off':
+            self.cache.enabled = False
+            self.cache.flush()
+        elif args[0] == 'flush':
+            if len(args) > 1 and not self.index.peripheral_exist(args[1]):
+                raise SyntaxWarning("Invalid peripheral")
+            self.cache.flush(args[1] if len(args) > 1 else None)
+        else:
+            stats = {
+                'enabled': self.cache.enabled,
+                'entries': len(self.cache.values),
+                'hits': self.cache.hits,
+                'misses': self.cache.misses,
+                'bypasses': self.cache.bypasses,
+            }
+            for name in stats:
+                print("{}: {}".format(name, stats[name]))
+            if len(args) > 1 and args[1] == 'reset':
+                self.cache.reset_stats()
+            return False, stats
+        return False, None
+
+    def do_batch(self, arg):
+        """
+            Queue register writes, and flush them at once
+
+            The command is batch begin|commit|abort, with:
+            - begin: start queuing the writes
+            - commit: write all the queued values, and stop queuing
+            - abort: drop all the queued values, and stop queuing
+            Writes to the same register are collapsed, and the registers are
+            written in address order, merging adjacent registers into block
+            transfers. Reads of a queued register return the queued value.
+
+            :param arg: batch command arguments
+            :return: False, and the number of registers written on commit
+        """
+        if arg not in ('begin', 'commit', 'abort'):
+            raise SyntaxWarning("Expected format is 'batch begin|commit|abort'")
+        if arg == 'begin':
+            if self.batch is not None:
+                raise SyntaxWarning("A batch is already started")
+            self.batch = WriteQueue()
+            return False, None
+        if self.batch is None:
+            raise SyntaxWarning("No batch started")
+        batch, self.batch = self.batch, None
+        if arg == 'abort':
+            return False, None
+        written = batch.flush(self.regice.client, self.burst_max)
+        for peripheral, register, value in written:
+            self.cache.update(peripheral, register, value)
+        return False, len(written)
+
+    def get_snapshot_registers(self):
+        """
+            Get the registers covered by snapshots
+
+            :return: A dictionary of tuple (peripheral, RegisterInfo),
+                     indexed by address
+        """
+        if self.snapshot_registers is None:
+            self.snapshot_registers = get_snapshot_registers(self.index)
+        return self.snapshot_registers
+
+    def load_snapshot(self, name):
+        """
+            Load a snapshot from a file, or read it from the target
+
+            :param name: The path of the snapshot file, or 'live'
+            :return: A Snapshot
+        """
+        if name == 'live':
+            return take_snapshot(self.regice.client, self.get_snapshot_registers(),
+                                 self.burst_max)
+        return Snapshot.load(name)
+
+    def do_snapshot(self, arg):
+        """
+            Save, compare and restore the state of all the registers
+
+            The command is snapshot save|diff|restore, with:
+            - save <file>: read all the registers and save them to file
+            - diff <file> <file|live>: display the registers that differ
+              between two snapshots, or between a snapshot and the target
+            - restore <file>: write back the registers that differ from the
+              snapshot, in address order. Read-only registers are skipped.
+            Registers with read side effects and write-only registers are
+            never part of a snapshot.
+
+            :param arg: snapshot command arguments
+            :return: False, and the number of registers saved for save,
+                     a list of tuple (name, value, other value) for diff,
+                     and the number of registers written for restore
+        """
+        args = arg.split()
+        if len(args) == 2 and args[0] == 'save':
+            snapshot = self.load_snapshot('live')
+            try:
+                snapshot.save(args[1])
+            except OSError as ex:
+                raise SyntaxWarning("Failed to save snapshot: {}".format(ex))
+            return False, len(snapshot.addresses)
+
+        if len(args) == 3 and args[0] == 'diff':
+            registers = self.get_snapshot_registers()
+            diffs = []
+            for address, value, other in self.load_snapshot(args[1]).diff(
+                    self.load_snapshot(args[2])):
+                if address not in registers:
+                    continue
+                peripheral, register = registers[address]
+                name = peripheral + '.' + register.name
+                print("{}: 0x{} -> 0x{}".format(name, format(value, register.read_format),
+                                               format(other, register.read_format)))
+                fields = register.decode(value)
+                others = register.decode(other)
+                for field in fields:
+                    if fields[field] != others[field]:
+                        print(" {}: {} -> {}".format(field, fields[field], others[field]))
+                diffs.append((name, value, other))
+            return False, diffs
+
+        if len(args) == 2 and args[0] == 'restore':
+            registers = self.get_snapshot_registers()
+            snapshot = self.load_snapshot(args[1])
+            queue = self.batch if self.batch is not None else WriteQueue()
+            count = 0
+            for address, _value, saved in self.load_snapshot('live').diff(snapshot):
+                if address not in registers:
+                    continue
+                peripheral, register = registers[address]
+                if register.access == 'read-only':
+                    continue
+                queue.put(peripheral, register, saved)
+                count += 1
+            if queue is not self.batch:
+                for peripheral, register, value in queue.flush(self.regice.client,
+                                                               self.burst_max):
+                    self.cache.update(peripheral, register, value)
+            return False, count
+
+        raise SyntaxWarning("Expected format is 'snapshot save <file>|"
+                            "diff <file> <file|live>|restore <file>'")
+
+    def do_apply(self, arg):
+        """
+            Apply a register configuration file
+
+            The command is apply [-n] <file>, with:
+            - file: a JSON, YAML or INI file assigning values to
+                    peripheral.register[.field] names
+            If '-n' argument is set, nothing is written, and the planned
+            writes are only displayed.
+
+            All the names are resolved before accessing the target, and the
+            fields of a register are merged into a single write. The current
+            value of the registers is read in bursts, and only the registers
+            whose value changes are written, in address order. Write-only
+            registers and registers with read side effects are never read,
+            so they must be assigned as a whole, and are always written.
+
+            :param arg: apply command arguments
+            :return: False, and a list of tuple (name, current value, new value)
+                     of the registers written, or to write if '-n' is set.
+                     The current value of the registers that are not read
+                     is None.
+        """
+        args = self.get_args(arg)
+        dry_run, args = self.test_first_arg(args, "-n")
+        if len(args) != 1:
+            raise SyntaxWarning("Expected format is 'apply [-n] <file>'")
+        registers = resolve_config(self.index, load_config(args[0]))
+
+        current = {}
+        readable = []
+        for peripheral, info, _mask, _value in registers:
+            pending = None if self.batch is None else self.batch.get(peripheral, info)
+            if pending is not None:
+                current[id(info)] = pending
+            elif not info.is_write_only() and not info.side_effect:
+                readable.append((peripheral, info))
+        for _peripheral, info, value in self.read_registers(
+                readable, self.burst_gap, self.burst_max):
+            current[id(info)] = value
+
+        queue = self.batch if self.batch is not None else WriteQueue()
+        changes = []
+        for peripheral, info, mask, value in registers:
+            old = current.get(id(info))
+            if old is not None and not (old ^ value) & mask:
+                continue
+            new = info.update(old or 0, mask, value)
+            name = peripheral + '.' + info.name
+            if old is None:
+                print("{} = 0x{}".format(name, format(new, info.read_format)))
+            else:
+                print("{}: 0x{} -> 0x{}".format(name, format(old, info.read_format),
+                                               format(new, info.read_format)))
+            changes.append((name, old, new))
+            if not dry_run:
+                queue.put(peripheral, info, new)
+        if not dry_run and queue is not self.batch:
+            for peripheral, register, value in queue.flush(self.regice.client,
+                                                           self.burst_max):
+                self.cache.update(peripheral, register, value)
+        return False, changes
+
+    def get_memory_args(self, arg, count, usage):
+        """
+            Parse the arguments of a raw memory command
+
+            :param arg: The command arguments, starting with [-w width] <address>
+            :param count: The minimum number of arguments after the options
+            :param usage: The expected format of the command
+            :return: A tuple with the width, the address, and the remaining
+                     arguments (address excluded)
+        """
+        args = self.get_args(arg)
+        width, args = self.test_first_option(args, "-w", 32)
+        if width not in (8, 16, 32) or len(args) < count:
+            raise SyntaxWarning("Expected format is '{}'".format(usage))
+        try:
+            address = int(args[0], 0)
+        except ValueError:
+            raise SyntaxWarning("Invalid address " + args[0])
+        if address % (width // 8):
+            raise SyntaxWarning("Address must be aligned on {} bits".format(width))
+        return width, address, args[1:]
+
+    def get_memory_length(self, arg, width):
+        """
+            Parse the length argument of a raw memory command
+
+            :param arg: The length, in bytes
+            :param width: The size of a word, in bits
+            :return: The length
+        """
+        try:
+            length = int(arg, 0)
+        except ValueError:
+            raise SyntaxWarning("Invalid length " + arg)
+        if length <= 0 or length % (width // 8):
+            raise SyntaxWarning("Length must be a multiple of {} bits".format(width))
+        return length
+
+    def get_memory_chunks(self, length):
+        """
+            Split a raw memory transfer in chunks
+
+            A single buffer of at most memory_chunk bytes is allocated,
+            and each chunk is a view of it.
+
+            :param length: The length of the transfer, in bytes
+            :return: A generator of tuple (offset, memoryview)
+        """
+        buffer = memoryview(bytearray(min(self.memory_chunk, length)))
+        offset = 0
+        while offset < length:
+            size = min(len(buffer), length - offset)
+            yield offset, buffer[:size]
+            offset += size
+
+    def test_memory_write(self):
+        """
+            Test if raw memory could be written, and drop the shadow cache
+
+            Raw memory writes may change any register, and they are never
+            queued in a batch.
+        """
+        if self.batch is not None:
+            raise SyntaxWarning("Raw memory writes are not allowed in a batch")
+        self.cache.flush()
+
+    def do_md(self, arg):
+        """
+            Display the content of memory
+
+            The command is md [-w 8|16|32] <address> <length>, with:
+            - width: the size of the words to read, 32 bits by default
+            - address: the address of the first byte
+            - length: the number of bytes to read
+            Memory is read in chunks of memory_chunk bytes, and displayed
+            as soon as a chunk has been read.
+
+            :param arg: md command arguments
+            :return: False, and the number of bytes read
+        """
+        usage = "md [-w 8|16|32] <address> <length>"
+        width, address, args = self.get_memory_args(arg, 2, usage)
+        length = self.get_memory_length(args[0], width)
+        for offset, chunk in self.get_memory_chunks(length):
+            read_memory(self.regice.client, address + offset, chunk, width)
+            sys.stdout.write("\n".join(hexdump(address + offset, chunk, width)) + "\n")
+        return False, length
+
+    def do_mw(self, arg):
+        """
+            Write words to memory
+
+            The command is mw [-w 8|16|32] <address> <value> [value [...]], with:
+            - width: the size of the words to write, 32 bits by default
+            - address: the address of the first word
+            - value: the words to write, at consecutive addresses
+
+            :param arg: mw command arguments
+            :return: False, and the number of bytes written
+        """
+        usage = "mw [-w 8|16|32] <address> <value> [value [...]]"
+        width, address, args = self.get_memory_args(arg, 2, usage)
+        try:
+            words = array(TYPECODES[width], [int(value, 0) for value in args])
+        except (ValueError, OverflowError):
+            raise SyntaxWarning("Invalid value for {} bits words".format(width))
+        if sys.byteorder != 'little':
+            words.byteswap()
+        self.test_memory_write()
+        write_memory(self.regice.client, address, memoryview(words).cast('B'), width)
+        return False, len(words) * width // 8
+
+    def do_mfill(self, arg):
+        """
+            Fill memory with a pattern
+
+            The command is mfill [-w 8|16|32] <address> <length> <pattern>, with:
+            - width: the size of the pattern, 32 bits by default
+            - address: the address of the first byte
+            - length: the number of bytes to fill
+            - pattern: the word to repeat
+
+            :param arg: mfill command arguments
+            :return: False, and the number of bytes written
+        """
+        usage = "mfill [-w 8|16|32] <address> <length> <pattern>"
+        width, address, args = self.get_memory_args(arg, 3, usage)
+        length = self.get_memory_length(args[0], width)
+        try:
+            pattern = array(TYPECODES[width], [int(args[1], 0)])
+        except (ValueError, OverflowError):
+            raise SyntaxWarning("Invalid pattern " + args[1])
+        if sys.byteorder != 'little':
+            pattern.byteswap()
+        self.test_memory_write()
+        for offset, chunk in self.get_memory_chunks(length):
+            # All the chunks are views of the same buffer, fill it only once
+            if not offset:
+                chunk.cast(TYPECODES[width])[:] = pattern * (len(chunk) * 8 // width)
+            write_memory(self.regice.client, address + offset, chunk, width)
+        return False, length
+
+    def do_msave(self, arg):
+        """
+            Save the content of memory to a file
+
+            The command is msave [-w 8|16|32] <address> <length> <file>, with:
+            - width: the size of the words to read, 32 bits by default
+            - address: the address of the first byte
+            - length: the number of bytes to save
+            - file: the path of the file
+
+            :param arg: msave command arguments
+            :return: False, and the number of bytes saved
+        """
+        usage = "msave [-w 8|16|32] <address> <length> <file>"
+        width, address, args = self.get_memory_args(arg, 3, usage)
+        length = self.get_memory_length(args[0], width)
+        try:
+            with open(args[1], 'wb') as memory_file:
+                for offset, chunk in self.get_memory_chunks(length):
+                    read_memory(self.regice.client, address + offset, chunk, width)
+                    memory_file.write(chunk)
+        except OSError as ex:
+            raise SyntaxWarning("Failed to save memory: {}".format(ex))
+        return False, length
+
+    def do_mload(self, arg):
+        """
+            Load the content of a file to memory
+
+            The command is mload [-w 8|16|32] <address> <length> <file>, with:
+            - width: the size of the words to write, 32 bits by default
+            - address: the address of the first byte
+            - length: the number of bytes to load
+            - file: the path of the file
+
+            :param arg: mload command arguments
+            :return: False, and the number of bytes loaded
+        """
+        usage = "mload [-w 8|16|32] <address> <length> <file>"
+        width, address, args = self.get_memory_args(arg, 3, usage)
+        length = self.get_memory_length(args[0], width)
+        self.test_memory_write()
+        try:
+            with open(args[1], 'rb') as memory_file:
+                for offset, chunk in self.get_memory_chunks(length):
+                    if memory_file.readinto(chunk) != len(chunk):
+                        raise SyntaxWarning("File {} is too short".format(args[1]))
+                    write_memory(self.regice.client, address + offset, chunk, width)
+        except OSError as ex:
+            raise SyntaxWarning("Failed to load memory: {}".format(ex))
+        return False, length
+
+    def share_client(self):
+        """
+            Make the client of regice safe to use from several threads
+
+            All the target accesses are serialized by a lock, which is only
+            held during a single access.
+        """
+        if self.client_lock is None:
+            self.client_lock = threading.Lock()
+            wrap_client(self.regice,
+                        lambda client: LockedClient(client, self.client_lock))
+
+    def do_log(self, arg):
+        """
+            Periodically log registers to a file, in background
+
+            The command is log start|stop|list, with:
+            - start <name> <selector> [selector [...]] [--period ms] --out <file>:
+              read the registers matching the selectors every period
+              (1000 ms by default) and append them to file
+            - stop <name>: stop logging, and write the pending samples
+            - list: list the logs, with their number of samples and overruns
+              (samples skipped because reading the registers took longer
+              than the period)
+            Selectors are the same as the dump command. Registers with read
+            side effects and write-only registers could not be logged.
+            The target is shared with the foreground commands, one access
+            at a time. The accesses of a log are accounted (see the stats
+            command) and recorded as the 'log:<name>' command.
+            The samples are written to the file at least every
+            log_flush_interval seconds (see memtool.logger for the format).
+
+            :param arg: log command arguments
+            :return: False, and the number of registers logged for start,
+                     the number of samples for stop, and the list of logs
+                     for list
+        """
+        args = self.get_args(arg)
+        if len(args) >= 3 and args[0] == 'start':
+            name = args[1]
+            if name in self.logs:
+                raise SyntaxWarning("Log {} already started".format(name))
+            options = {'--period': '1000', '--out': None}
+            selectors = []
+            args = iter(args[2:])
+            for selector in args:
+                if selector in options:
+                    options[selector] = next(args, None)
+                else:
+                    selectors.append(selector)
+            try:
+                period = float(options['--period']) / 1000
+            except (TypeError, ValueError):
+                period = 0
+            if period <= 0:
+                raise SyntaxWarning("Invalid period " + str(options['--period']))
+            if not options['--out']:
+                raise SyntaxWarning("Expected format is 'log start <name> <selector> "
+                                    "[selector [...]] [--period ms] --out <file>'")
+            registers = []
+            columns = []
+            hazards = []
+            peripherals = set()
+            for selected, peripheral, info, _field in self.get_selection(selectors, False):
+                if info.side_effect or info.is_write_only():
+                    raise SyntaxWarning("Register {} could not be logged".format(selected))
+                registers.append(info)
+                columns.append((selected, info.address, info.size))
+                if peripheral not in peripherals:
+                    peripherals.add(peripheral)
+                    hazards.extend(self.index.get_peripheral(peripheral).get_side_effect_registers())
+            if not registers:
+                raise SyntaxWarning("No register to log")
+
+            writer = LogWriter(options['--out'], columns, period)
+            self.share_client()
+            logger = RegisterLogger(self.regice, registers, writer, period,
+                                    self.log_flush_interval, self.burst_gap,
+                                    self.burst_max, hazards, self.stats,
+                                    'log:' + name)
+            self.logs[name] = logger
+            logger.start()
+            return False, len(registers)
+
+        if len(args) == 2 and args[0] == 'stop':
+            logger = self.logs.pop(args[1], None)
+            if logger is None:
+                raise SyntaxWarning("Invalid log " + args[1])
+            logger.stop()
+            if logger.error is not None:
+                raise SyntaxWarning("Log {} failed: {}".format(args[1], logger.error))
+            return False, logger.writer.count
+
+        if args == ['list']:
+            for name in sorted(self.logs):
+                logger = self.logs[name]
+                state = "" if logger.is_alive() else " (failed: {})".format(logger.error)
+                print("{}: {} samples, {} overruns{}".format(
+                    name, logger.writer.count, logger.overruns, state))
+            return False, sorted(self.logs)
+
+        raise SyntaxWarning("Expected format is 'log start <name> <selector> "
+                            "[selector [...]] [--period ms] --out <file>|"
+                            "stop <name>|list'")
+
+    def stop_logs(self):
+        """
+            Stop all the logs of all the targets, and write their pending samples
+        """
+        for target in self.targets.values():
+            for name in list(target.logs):
+                target.logs.pop(name).stop()
+
+    def do_stats(self, arg):
+        """
+            Display the target accesses done by each command
+
+            The command is stats [reset]. For each command, this displays
+            the number of calls, the total time, the time spent in target
+            accesses, the number of reads and writes, and the number of bytes
+            transferred. 'stats reset' clears the statistics after displaying them.
+
+            :param arg: stats command arguments
+            :return: False, and the statistics as a dictionary
+        """
+        if arg not in ('', 'reset'):
+            raise SyntaxWarning("Expected format is 'stats [reset]'")
+        stats = self.stats.to_dict()
+        print("{:<12} {:>8} {:>10} {:>10} {:>8} {:>8} {:>10}".format(
+            "command", "calls", "time", "target", "reads", "writes", "bytes"))
+        for command in stats:
+            command_stats = stats[command]
+            print("{:<12} {:>8} {:>10.6f} {:>10.6f} {:>8} {:>8} {:>10}".format(
+                command, command_stats['calls'], command_stats['time'],
+                command_stats['target_time'], command_stats['reads'],
+                command_stats['writes'],
+                command_stats['bytes_read'] + command_stats['bytes_written']))
+        if arg == 'reset':
+            self.stats.reset()
+        return False, stats
+
+    def run_commands(self, commands):
+        """
+            Run commands non-interactively
+
+            Empty lines and lines starting by '#' are ignored.
+            This stops on the first error, or if a command asks to quit.
+            A batch left open at the end is aborted.
+
+            :param commands: An iterable of command lines
+            :return: True if all the commands succeeded, otherwise False
+        """
+        self.strict = True
+        try:
+            for line in commands:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                stop = self.onecmd(line)
+                if stop and stop[0]:
+                    break
+            if self.batch is not None:
+                raise SyntaxWarning("Batch not committed")
+        except SyntaxWarning as ex:
+            print("{}: {}".format(line, ex), file=sys.stderr)
+            self.batch = None
+            return False
+        finally:
+            self.strict = False
+        return True
+
+    def complete_peripheral(self, text, line, begidx, _endidx):
+        """
+            Complete the peripheral name of the peripheral command
+
+            :param text: The text to complete
+            :return: A list of peripheral names starting by text
+        """
+        if line[:begidx].split()[1:]:
+            return []
+        return [name for name in self.index.get_peripheral_list()
+                if name.startswith(text)]
+
+    def get_session(self, peripheral):
+        """
+            Get the prompt of a peripheral
+
+            The prompts of the most recently used peripherals are kept,
+            so a 'peripheral <name> <subcommand>' line does not have to set
+            up a new one.
+
+            :param peripheral: The name of the peripheral
+            :return: The MemtoolPeripheralPrompt of the peripheral
+        """
+        session = self.sessions.get(peripheral)
+        if session is None:
+            session = MemtoolPeripheralPrompt(self, peripheral)
+            session.prompt = peripheral + ">"
+            self.sessions[peripheral] = session
+            if len(self.sessions) > self.sessions_max:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(peripheral)
+        session.test = self.test
+        session.strict = self.strict
+        return session
 
     def do_peripheral(self, arg):
         """
@@ -289,17 +1710,20 @@ class MemtoolPrompt(MemtoolPromptBase):
             This provides a set of commands that could be executed for
             a specific peripheral.
             The command is peripheral <peripheral_name> [subcommands [args, ...]].
-            Executing this command without arguments start a prompt.
+            Executing this command without arguments start a prompt,
+            which is not allowed in strict mode (scripts and server).
 
             :param arg: peripheral command arguments
             :return: False, and the data return by the subcommands
         """
         args = arg.split(' ', 1)
-        if not self.regice.peripheral_exist(args[0]) or not args:
+        if not self.index.peripheral_exist(args[0]):
             raise SyntaxWarning("Invalid peripheral")
 
-        cmd = MemtoolPeripheralPrompt(self, args[0])
-        cmd.prompt = args[0] + ">"
+        if len(args) == 1 and self.strict:
+            raise SyntaxWarning("Expected format is 'peripheral <peripheral_name> "
+                                "<subcommand> [args, ...]'")
+        cmd = self.get_session(args[0])
         if len(args) == 1:
             cmd.cmdloop()
         else:
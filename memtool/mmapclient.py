@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import mmap
+import os
+import sys
+from array import array
+from bisect import bisect_right
+
+from memtool.memory import TYPECODES
+
+class MappedWindow:
+    """
+        A memory mapped range of addresses
+
+        The mapping is viewed once per access width, so a register access
+        is a single memoryview indexing.
+    """
+    def __init__(self, fd, start, size, writable=True):
+        self.start = start
+        self.end = start + size
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        self.map = mmap.mmap(fd, size, access=access, offset=start)
+        self.view = memoryview(self.map)
+        self.views = {width: self.view.cast(TYPECODES[width])
+                      for width in TYPECODES}
+
+    def close(self):
+        for view in self.views.values():
+            view.release()
+        self.view.release()
+        self.map.close()
+
+def get_windows(regions, granularity=mmap.ALLOCATIONGRANULARITY):
+    """
+        Get the ranges of addresses to map
+
+        Regions are extended to the mapping granularity, and the regions
+        that overlap once extended are merged.
+
+        :param regions: A list of tuple (base address, size)
+        :param granularity: The granularity of the mappings, in bytes
+        :return: A list of tuple (start, size), sorted by address
+    """
+    windows = []
+    for base, size in sorted(regions):
+        start = base - base % granularity
+        end = -(-(base + max(size, 1)) // granularity) * granularity
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+    return [(start, end - start) for start, end in windows]
+
+def get_peripheral_regions(index):
+    """
+        Get the range of addresses used by each peripheral
+
+        :param index: The DeviceIndex of the target
+        :return: A list of tuple (base address, size)
+    """
+    regions = []
+    for name in index.get_peripheral_list():
+        peripheral = index.get_peripheral(name)
+        base = peripheral.base_address
+        end = max([info.address + info.size // 8
+                   for info in peripheral.registers.values()] + [base])
+        regions.append((base, end - base))
+    return regions
+
+class MmapClient:
+    """
+        A regice client that accesses the registers through memory mappings
+
+        This is meant to run memtool on the target itself, mapping the
+        peripherals from a physical memory device (e.g. /dev/mem). Any file
+        can be used instead, e.g. for testing. Register accesses are loads
+        and stores to the mapping, in the native byte order, and block
+        transfers are slice copies.
+
+        The regions to map are a list of tuple (base address, size),
+        e.g. from get_peripheral_regions().
+    """
+    def __init__(self, path, regions, writable=True):
+        fd = os.open(path, (os.O_RDWR if writable else os.O_RDONLY) |
+                     getattr(os, 'O_SYNC', 0))
+        try:
+            self.windows = [MappedWindow(fd, start, size, writable)
+                            for start, size in get_windows(regions)]
+        finally:
+            os.close(fd)
+        self.starts = [window.start for window in self.windows]
+        self.last = self.windows[0] if self.windows else None
+
+    def get_window(self, address, size):
+        window = self.last
+        if window is None or not window.start <= address < window.end:
+            i = bisect_right(self.starts, address) - 1
+            if i < 0 or address >= self.windows[i].end:
+                raise SyntaxWarning("Address 0x{:08x} is not mapped".format(address))
+            window = self.last = self.windows[i]
+        if address + size > window.end:
+            raise SyntaxWarning("Address 0x{:08x} is not mapped".format(address))
+        return window
+
+    def read(self, width, address):
+        size = width >> 3
+        window = self.get_window(address, size)
+        offset = address - window.start
+        if offset % size:
+            return int.from_bytes(window.views[8][offset:offset + size],
+                                  sys.byteorder)
+        return window.views[width][offset // size]
+
+    def write(self, width, address, value):
+        size = width >> 3
+        window = self.get_window(address, size)
+        offset = address - window.start
+        if offset % size:
+            window.views[8][offset:offset + size] = value.to_bytes(size, sys.byteorder)
+        else:
+            window.views[width][offset // size] = value
+
+    def read_burst(self, width, address, count):
+        size = width >> 3
+        window = self.get_window(address, count * size)
+        offset = address - window.start
+        if offset % size:
+            return [self.read(width, address + i * size) for i in range(count)]
+        offset //= size
+        return window.views[width][offset:offset + count].tolist()
+
+    def write_burst(self, width, address, values):
+        size = width >> 3
+        window = self.get_window(address, len(values) * size)
+        offset = address - window.start
+        if offset % size:
+            for i, value in enumerate(values):
+                self.write(width, address + i * size, value)
+            return
+        offset //= size
+        window.views[width][offset:offset + len(values)] = \
+            array(TYPECODES[width], values)
+
+    def close(self):
+        for window in self.windows:
+            window.close()
+        self.windows = []
+        self.starts = []
+        self.last = None
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import struct
+import sys
+
+class RegisterOutput:
+    """
+        Write register values to stdout, in a given format
+
+        Records are buffered, and written to stdout when the buffer is full,
+        or when flush() is called (at the end of each command).
+    """
+    buffer_size = 64 * 1024
+
+    def __init__(self):
+        self.buffer = []
+        self.size = 0
+
+    def write(self, data):
+        """
+            Append data to the buffer, and flush it if it is full
+
+            :param data: The text (or bytes, for binary formats) to write
+        """
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """
+            Write the buffer to stdout
+        """
+        if not self.buffer:
+            return
+        sys.stdout.write(''.join(self.buffer))
+        sys.stdout.flush()
+        self.buffer = []
+        self.size = 0
+
+    def emit(self, peripheral, name, info, value, field=None, fields=None):
+        """
+            Write the value of a register, or of one of its fields
+
+            :param peripheral: The name of the peripheral
+            :param name: The name to display
+            :param info: The RegisterInfo of the register
+            :param value: The value of the register, or of the field
+            :param field: The name of the field, if value is a field value
+            :param fields: The value of all the fields, if they must be written
+        """
+        raise NotImplementedError
+
+class TextOutput(RegisterOutput):
+    """
+        The human readable format
+    """
+    def emit(self, peripheral, name, info, value, field=None, fields=None):
+        if fields is None:
+            self.write("{} = 0x{}\n".format(name, format(value, info.read_format)))
+            return
+        self.write(name + ":\n")
+        for field in fields:
+            self.write(" {} = {}\n".format(field, fields[field]))
+
+class JsonlOutput(RegisterOutput):
+    """
+        One JSON object per register, or per field
+    """
+    def emit(self, peripheral, name, info, value, field=None, fields=None):
+        record = {
+            'peripheral': peripheral,
+            'register': info.name,
+            'address': info.address,
+            'value': value,
+        }
+        if field is not None:
+            record['field'] = field
+        if fields is not None:
+            record['fields'] = fields
+        self.write(json.dumps(record) + "\n")
+
+class CsvOutput(RegisterOutput):
+    """
+        One CSV row per register, or per field
+
+        The header is written before the first row.
+    """
+    def __init__(self):
+        super(CsvOutput, self).__init__()
+        self.header = False
+
+    def emit(self, peripheral, name, info, value, field=None, fields=None):
+        if not self.header:
+            self.write("peripheral,register,field,address,value\n")
+            self.header = True
+        row = "{},{},{},0x{:x},{}\n"
+        if fields is None:
+            self.write(row.format(peripheral, info.name, field or '', info.address, value))
+            return
+        for name in fields:
+            self.write(row.format(peripheral, info.name, name, info.address, fields[name]))
+
+class BinOutput(RegisterOutput):
+    """
+        Fixed size records of two little endian 64 bits integers
+
+        Each record is the address and the raw value of a register. Fields are
+        not decoded (verbose reads write the raw value), except for field reads
+        which write the value of the field.
+    """
+    record = struct.Struct('<QQ')
+
+    def emit(self, peripheral, name, info, value, field=None, fields=None):
+        self.write(self.record.pack(info.address, value))
+
+    def flush(self):
+        if not self.buffer:
+            return
+        stream = getattr(sys.stdout, 'buffer', None)
+        if stream is None:
+            self.buffer = []
+            self.size = 0
+            raise SyntaxWarning("Binary output requires a binary stdout")
+        sys.stdout.flush()
+        stream.write(b''.join(self.buffer))
+        stream.flush()
+        self.buffer = []
+        self.size = 0
+
+OUTPUT_FORMATS = {
+    'text': TextOutput,
+    'jsonl': JsonlOutput,
+    'csv': CsvOutput,
+    'bin': BinOutput,
+}
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+
+from memtool.targets import ThreadOutput
+
+class MemtoolRequestHandler(socketserver.StreamRequestHandler):
+    """
+        Handle the commands of a client
+
+        Each request is a line with a JSON object {"command": "<command line>"}.
+        Each response is a line with a JSON object, with:
+        - ok: True if the command succeeded
+        - result: the data returned by the command
+        - output: the text printed by the command
+        - error: the error message, if the command failed
+    """
+    def handle(self):
+        for line in self.rfile:
+            try:
+                command = json.loads(line.decode())['command']
+            except (ValueError, KeyError, TypeError):
+                response = {'ok': False, 'error': "Invalid request"}
+            else:
+                response = self.server.run_command(command)
+            self.wfile.write(json.dumps(response, default=str).encode() + b'\n')
+            self.wfile.flush()
+
+class MemtoolServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+        A server running memtool commands received on a Unix socket
+
+        The prompt (and so the regice instance, the SVD index and the target
+        connection) is kept for the whole life of the server. Each client is
+        served by its own thread, but commands are run one at a time, so the
+        accesses to the target are serialized.
+        The output of a command is captured for the thread running it only,
+        so the rest of the process keeps writing to stdout.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, prompt):
+        if os.path.exists(path):
+            os.unlink(path)
+        super(MemtoolServer, self).__init__(path, MemtoolRequestHandler)
+        self.prompt = prompt
+        self.prompt.strict = True
+        self.lock = threading.Lock()
+        self.output = ThreadOutput(sys.stdout)
+        sys.stdout = self.output
+
+    def server_close(self):
+        super(MemtoolServer, self).server_close()
+        if sys.stdout is self.output:
+            sys.stdout = self.output.stdout
+
+    def run_command(self, command):
+        """
+            Run a command, and build the response to send to the client
+
+            Any error (e.g. an I/O error of the target) is reported in the
+            response, so the connection of the client remains usable.
+
+            :param command: The command line
+            :return: The response, as a dictionary
+        """
+        output = io.StringIO()
+        with self.lock:
+            self.output.capture(output)
+            try:
+                data = self.prompt.onecmd(command)
+            except SyntaxWarning as ex:
+                return {'ok': False, 'error': str(ex), 'output': output.getvalue()}
+            except Exception as ex:
+                return {'ok': False, 'error': "{}: {}".format(type(ex).__name__, ex),
+                        'output': output.getvalue()}
+            finally:
+                self.output.capture(None)
+        return {
+            'ok': True,
+            'result': data[1] if data else None,
+            'output': output.getvalue(),
+        }
+
+def serve(prompt, path):
+    """
+        Serve memtool commands on a Unix socket, until interrupted
+
+        :param prompt: The MemtoolPrompt used to run the commands
+        :param path: The path of the Unix socket
+    """
+    server = MemtoolServer(path, prompt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
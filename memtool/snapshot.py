@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import struct
+import sys
+from array import array
+
+from memtool.burst import plan_bursts, read_burst
+
+SNAPSHOT_MAGIC = b'MTSNAP01'
+
+class Snapshot:
+    """
+        The value of a set of registers
+
+        Registers are stored as two parallel arrays of addresses and values,
+        sorted by address.
+    """
+    def __init__(self, addresses=None, values=None):
+        self.addresses = addresses if addresses is not None else array('Q')
+        self.values = values if values is not None else array('Q')
+
+    def save(self, path):
+        """
+            Save the snapshot to a file
+
+            The file is made of a magic, the number of registers, then all the
+            addresses and all the values as little endian 64 bits integers.
+
+            :param path: The path of the file
+        """
+        addresses = array('Q', self.addresses)
+        values = array('Q', self.values)
+        if sys.byteorder != 'little':
+            addresses.byteswap()
+            values.byteswap()
+        with open(path, 'wb') as snapshot_file:
+            snapshot_file.write(SNAPSHOT_MAGIC)
+            snapshot_file.write(struct.pack('<Q', len(addresses)))
+            addresses.tofile(snapshot_file)
+            values.tofile(snapshot_file)
+
+    @staticmethod
+    def load(path):
+        """
+            Load a snapshot from a file
+
+            :param path: The path of the file
+            :return: A Snapshot, otherwise raise an exception
+        """
+        try:
+            with open(path, 'rb') as snapshot_file:
+                if snapshot_file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                    raise SyntaxWarning("Invalid snapshot file " + path)
+                count, = struct.unpack('<Q', snapshot_file.read(8))
+                addresses = array('Q')
+                values = array('Q')
+                addresses.fromfile(snapshot_file, count)
+                values.fromfile(snapshot_file, count)
+        except (OSError, EOFError, struct.error) as ex:
+            raise SyntaxWarning("Failed to load snapshot {}: {}".format(path, ex))
+        if sys.byteorder != 'little':
+            addresses.byteswap()
+            values.byteswap()
+        return Snapshot(addresses, values)
+
+    def diff(self, other):
+        """
+            Compare two snapshots
+
+            When both snapshots cover the same registers (the usual case),
+            the address arrays are compared at once and the values are compared
+            in bulk. Otherwise, only the registers present in both snapshots
+            are compared.
+
+            :param other: The Snapshot to compare with
+            :return: A list of tuple (address, value, other value),
+                     sorted by address
+        """
+        if self.addresses == other.addresses:
+            if self.values == other.values:
+                return []
+            return [(address, value, other_value) for address, value, other_value
+                    in zip(self.addresses, self.values, other.values)
+                    if value != other_value]
+        others = dict(zip(other.addresses, other.values))
+        return [(address, value, others[address]) for address, value
+                in zip(self.addresses, self.values)
+                if address in others and value != others[address]]
+
+def get_snapshot_registers(index):
+    """
+        Get all the registers that could be part of a snapshot
+
+        Registers with read side effects, and write-only registers,
+        are never part of a snapshot.
+
+        :param index: The DeviceIndex of the device
+        :return: A dictionary of tuple (peripheral, RegisterInfo),
+                 indexed by address
+    """
+    registers = {}
+    for peripheral in index.get_peripheral_list():
+        for register in index.get_peripheral(peripheral).registers.values():
+            if register.side_effect or register.is_write_only():
+                continue
+            registers.setdefault(register.address, (peripheral, register))
+    return registers
+
+def take_snapshot(client, registers, max_size):
+    """
+        Read all the registers of a snapshot from the target
+
+        :param client: The regice client to use
+        :param registers: The registers, as returned by get_snapshot_registers()
+        :param max_size: The maximum size of a burst, in bytes
+        :return: A Snapshot
+    """
+    snapshot = Snapshot()
+    infos = [register for _peripheral, register in registers.values()]
+    for burst in plan_bursts(infos, 0, max_size):
+        for register, value in read_burst(client, burst):
+            snapshot.addresses.append(register.address)
+            snapshot.values.append(value)
+    return snapshot
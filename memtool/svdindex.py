@@ -0,0 +1,498 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import bisect
+import fnmatch
+import hashlib
+import mmap
+import os
+import pickle
+import re
+import struct
+
+INDEX_VERSION = 2
+
+class FieldInfo:
+    """
+        Metadata of a register field, precomputed from the SVD
+    """
+    def __init__(self, name, shift, width, access, modified_write_values):
+        self.name = name
+        self.shift = shift
+        self.width = width
+        self.mask = ((1 << width) - 1) << shift
+        self.access = access
+        self.modified_write_values = modified_write_values
+
+    def decode(self, value):
+        """
+            Extract the value of the field from the value of its register
+
+            :param value: The raw value of the register
+            :return: The value of the field
+        """
+        return (value & self.mask) >> self.shift
+
+    def encode(self, value):
+        """
+            Shift the value of the field to its position in the register
+
+            :param value: The value of the field
+            :return: The value shifted and masked
+        """
+        if value < 0 or value >> self.width:
+            raise SyntaxWarning("Value too large for field " + self.name)
+        return value << self.shift
+
+class RegisterInfo:
+    """
+        Metadata of a register, precomputed from the SVD
+
+        This holds everything memtool needs to access a register without
+        walking the SVD again.
+    """
+    def __init__(self, name, address, size, access, side_effect, fields):
+        self.name = name
+        self.address = address
+        self.size = size
+        self.access = access
+        self.side_effect = side_effect
+        self.fields = fields
+        self.volatile = self.is_volatile()
+        self.read_format = "0>{}x".format(size)
+
+    def is_volatile(self):
+        """
+            Test if the value of the register could change behind our back
+
+            A register is volatile if reading it has side effects,
+            if it is a status register (read-only, or with read-only fields),
+            if it has fields with modifiedWriteValues semantic (e.g. oneToClear),
+            or if it could not be read back (write-only).
+
+            :return: True if the register must never be cached
+        """
+        if self.side_effect or self.access in ('read-only', 'write-only'):
+            return True
+        for field in self.fields.values():
+            if field.access == 'read-only' or field.modified_write_values:
+                return True
+        return False
+
+    def decode(self, value):
+        """
+            Extract the value of all the fields from the value of the register
+
+            :param value: The raw value of the register
+            :return: A dictionary with the value of each field
+        """
+        return {name: field.decode(value) for name, field in self.fields.items()}
+
+    def is_write_only(self):
+        """
+            :return: True if the register could not be read back
+        """
+        return self.access == 'write-only'
+
+    def owns(self, field):
+        """
+            Test if a field covers the whole register
+
+            :param field: The FieldInfo to test
+            :return: True if writing the field overwrite every bit of the register
+        """
+        return field.mask == (1 << self.size) - 1
+
+    def merge(self, current, field, value):
+        """
+            Compute the value to write to update one field of the register
+
+            :param current: The current value of the register
+            :param field: The FieldInfo of the field to update
+            :param value: The new value of the field
+            :return: The value to write to the register
+        """
+        return self.update(current, field.mask, field.encode(value))
+
+    def update(self, current, mask, value):
+        """
+            Compute the value to write to update some bits of the register
+
+            This replaces the masked bits in the current value of the register.
+            The bits of the other fields having a modifiedWriteValues
+            semantic are set so writing them back leaves them unchanged
+            (e.g. 0 for a oneToClear field).
+
+            :param current: The current value of the register
+            :param mask: The bits to update
+            :param value: The new value of the bits, already shifted
+            :return: The value to write to the register
+        """
+        value = (current & ~mask) | (value & mask)
+        for other in self.fields.values():
+            if other.mask & mask or not other.modified_write_values:
+                continue
+            if other.modified_write_values.startswith('one'):
+                value &= ~other.mask
+            elif other.modified_write_values.startswith('zero'):
+                value |= other.mask
+        return value
+
+def get_fields(svd_register):
+    """
+        Build the field table of a register
+
+        :param svd_register: The SVD register
+        :return: A dictionary of FieldInfo, indexed by field name
+    """
+    fields = {}
+    for svd_field in getattr(svd_register, 'fields', None) or []:
+        fields[svd_field.name] = FieldInfo(
+            svd_field.name, svd_field.bit_offset, svd_field.bit_width,
+            getattr(svd_field, 'access', None),
+            getattr(svd_field, 'modified_write_values', None))
+    return fields
+
+def has_read_side_effect(svd_register):
+    """
+        Test if reading a register may change the state of the device
+
+        :param svd_register: The SVD register to test
+        :return: True if the register, or one of its fields, has a readAction
+    """
+    if getattr(svd_register, 'read_action', None):
+        return True
+    for field in getattr(svd_register, 'fields', None) or []:
+        if getattr(field, 'read_action', None):
+            return True
+    return False
+
+class PeripheralIndex:
+    """
+        Metadata of all the registers of a peripheral
+
+        This is built once from the SVD and then used to resolve register
+        names and addresses without going through regice.
+    """
+    def __init__(self, name, base_address, registers):
+        self.name = name
+        self.base_address = base_address
+        self.registers = registers
+        self.hazards = [info for info in registers.values() if info.side_effect]
+        self.names = sorted(registers)
+
+    def complete(self, text):
+        """
+            Get the register or register '.' field names starting by text
+
+            Register names are kept sorted, so this only costs a binary search
+            and the number of matches, whatever the number of registers.
+
+            :param text: The beginning of the name
+            :return: A list of matching names
+        """
+        if '.' in text:
+            register, field = text.split('.', 1)
+            info = self.registers.get(register)
+            if info is None:
+                return []
+            return [register + '.' + name for name in info.fields
+                    if name.startswith(field)]
+        start = bisect.bisect_left(self.names, text)
+        end = start
+        while end < len(self.names) and self.names[end].startswith(text):
+            end += 1
+        return self.names[start:end]
+
+    def get_side_effect_registers(self):
+        """
+            Get the registers that must not be read as part of a burst
+
+            :return: A list of RegisterInfo
+        """
+        return self.hazards
+
+class DeviceIndex:
+    """
+        Metadata of all the peripherals of a device
+
+        Only the list of peripherals is loaded up front. The index of a
+        peripheral is built (or loaded from the index file) the first time
+        it is requested, and then kept for the rest of the session.
+    """
+    def __init__(self, peripherals, loader):
+        self.names = list(peripherals)
+        self.known = set(self.names)
+        self.peripherals = {}
+        self.loader = loader
+        self.register_names = None
+        self.field_names = None
+
+    def peripheral_exist(self, peripheral):
+        """
+            :param peripheral: The name of the peripheral
+            :return: True if the peripheral exists
+        """
+        return peripheral in self.known
+
+    def get_peripheral_list(self):
+        """
+            :return: The list of peripheral names, in SVD order
+        """
+        return list(self.names)
+
+    def get_peripheral(self, peripheral):
+        """
+            Get the index of a peripheral
+
+            :param peripheral: The name of the peripheral
+            :return: The PeripheralIndex, otherwise raise an exception
+        """
+        index = self.peripherals.get(peripheral)
+        if index is None:
+            if peripheral not in self.known:
+                raise SyntaxWarning("Invalid peripheral")
+            index = self.peripherals[peripheral] = self.loader(peripheral)
+        return index
+
+    def get_register_names(self):
+        """
+            Get the full name of every register of the device
+
+            This is built once, the first time it is requested.
+
+            :return: A list of tuple (peripheral '.' register, peripheral,
+                     RegisterInfo), in SVD order
+        """
+        if self.register_names is None:
+            self.register_names = [
+                (peripheral + '.' + name, peripheral, info)
+                for peripheral in self.names
+                for name, info in self.get_peripheral(peripheral).registers.items()]
+        return self.register_names
+
+    def get_field_names(self):
+        """
+            Get the full name of every field of the device
+
+            This is built once, the first time it is requested.
+
+            :return: A list of tuple (peripheral '.' register '.' field,
+                     peripheral, RegisterInfo, field), in SVD order
+        """
+        if self.field_names is None:
+            self.field_names = [
+                (name + '.' + field, peripheral, info, field)
+                for name, peripheral, info in self.get_register_names()
+                for field in info.fields]
+        return self.field_names
+
+    def select(self, selector, regex=False, fields=True):
+        """
+            Get the registers, or fields, matching a selector
+
+            A glob selector has the form peripheral[.register[.field]],
+            e.g. 'UART*.*CTRL*' or '*.STATUS.ERR'. A peripheral alone selects
+            all its registers. A regex selector is matched against the full
+            names of registers (peripheral.register) and, if fields is set,
+            of fields (peripheral.register.field).
+
+            :param selector: The glob or regex pattern
+            :param regex: Set to True if selector is a regex
+            :param fields: Set to False to only select registers
+            :return: A list of tuple (name, peripheral, RegisterInfo,
+                     field name or None)
+        """
+        if regex:
+            try:
+                pattern = re.compile(selector)
+            except re.error as ex:
+                raise SyntaxWarning("Invalid regex {}: {}".format(selector, ex))
+            matches = [(name, peripheral, info, None)
+                       for name, peripheral, info in self.get_register_names()
+                       if pattern.fullmatch(name)]
+            if fields:
+                matches.extend(item for item in self.get_field_names()
+                               if pattern.fullmatch(item[0]))
+            return matches
+
+        parts = selector.split('.')
+        if len(parts) == 1:
+            parts.append('*')
+        if len(parts) > 3 or (len(parts) == 3 and not fields):
+            raise SyntaxWarning("Invalid selector " + selector)
+        pattern = re.compile(fnmatch.translate('.'.join(parts)))
+        if len(parts) == 2:
+            return [(name, peripheral, info, None)
+                    for name, peripheral, info in self.get_register_names()
+                    if pattern.match(name)]
+        return [item for item in self.get_field_names() if pattern.match(item[0])]
+
+class IndexFile:
+    """
+        A memory mapped index file
+
+        The file starts with the length of the header (a 64 bits little
+        endian integer), followed by the pickled header, and then by one
+        pickled PeripheralIndex per peripheral. The header holds the offset
+        and the length of each peripheral, so a peripheral could be
+        unpickled without reading the rest of the file.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as index_file:
+            self.map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        length, = struct.unpack_from('<Q', self.map)
+        header = pickle.loads(self.map[8:8 + length])
+        if header['version'] != INDEX_VERSION:
+            raise pickle.UnpicklingError("Unsupported index version")
+        self.data = 8 + length
+        self.names = [name for name, _offset, _length in header['peripherals']]
+        self.offsets = {name: (offset, length)
+                        for name, offset, length in header['peripherals']}
+
+    def load(self, peripheral):
+        """
+            Unpickle the index of a peripheral
+
+            :param peripheral: The name of the peripheral
+            :return: A PeripheralIndex
+        """
+        offset, length = self.offsets[peripheral]
+        start = self.data + offset
+        return pickle.loads(self.map[start:start + length])
+
+def save_index_file(path, index):
+    """
+        Save the index of all the peripherals to an index file
+
+        This builds the index of every peripheral not yet requested.
+
+        :param path: The path of the index file
+        :param index: The DeviceIndex to save
+    """
+    blobs = []
+    peripherals = []
+    offset = 0
+    for name in index.get_peripheral_list():
+        blob = pickle.dumps(index.get_peripheral(name), pickle.HIGHEST_PROTOCOL)
+        peripherals.append((name, offset, len(blob)))
+        blobs.append(blob)
+        offset += len(blob)
+    header = pickle.dumps({'version': INDEX_VERSION, 'peripherals': peripherals},
+                          pickle.HIGHEST_PROTOCOL)
+    with open(path + '.tmp', 'wb') as index_file:
+        index_file.write(struct.pack('<Q', len(header)))
+        index_file.write(header)
+        for blob in blobs:
+            index_file.write(blob)
+    os.replace(path + '.tmp', path)
+
+def get_svd_peripheral(regice, peripheral):
+    """
+        Get the SVD object of a peripheral
+
+        :param regice: The regice instance holding the SVD
+        :param peripheral: The name of the peripheral
+        :return: The SVD peripheral, otherwise raise an exception
+    """
+    for svd_peripheral in regice.svd.peripherals:
+        if svd_peripheral.name == peripheral:
+            return svd_peripheral
+    raise SyntaxWarning("Invalid peripheral")
+
+def build_peripheral_index(regice, peripheral):
+    """
+        Build the index of a peripheral from the SVD
+
+        :param regice: The regice instance holding the SVD
+        :param peripheral: The name of the peripheral
+        :return: A PeripheralIndex
+    """
+    base_address = regice.get_base_address(peripheral)
+    registers = {}
+    for svd_register in get_svd_peripheral(regice, peripheral).registers:
+        name = svd_register.name
+        size = svd_register.size or regice.get_size(peripheral, name)
+        registers[name] = RegisterInfo(
+            name, base_address + svd_register.address_offset, size,
+            getattr(svd_register, 'access', None),
+            has_read_side_effect(svd_register), get_fields(svd_register))
+    return PeripheralIndex(peripheral, base_address, registers)
+
+def build_device_index(regice):
+    """
+        Build the index of the device from the SVD
+
+        The index of a peripheral is only built when it is requested.
+
+        :param regice: The regice instance holding the SVD
+        :return: A DeviceIndex
+    """
+    return DeviceIndex(regice.get_peripheral_list(),
+                       lambda peripheral: build_peripheral_index(regice, peripheral))
+
+def get_index_path(svd_file):
+    """
+        Get the path of the index file of a SVD
+
+        The index file is named after the hash of the SVD content,
+        so any change to the SVD will use a new index file.
+
+        :param svd_file: The path of the SVD file
+        :return: The path of the index file
+    """
+    digest = hashlib.sha256()
+    digest.update(str(INDEX_VERSION).encode())
+    with open(svd_file, 'rb') as svd:
+        for chunk in iter(lambda: svd.read(1 << 20), b''):
+            digest.update(chunk)
+    cache_dir = os.environ.get('XDG_CACHE_HOME',
+                               os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_dir, 'regice', digest.hexdigest() + '.index')
+
+def load_device_index(svd_file, regice, rebuild=False):
+    """
+        Load the index of a SVD from disk, or build it and save it
+
+        :param svd_file: The path of the SVD file
+        :param regice: The regice instance, used only if the index must be built
+        :param rebuild: Set to True to ignore the index saved on disk
+        :return: A DeviceIndex
+    """
+    path = get_index_path(svd_file)
+    if not rebuild:
+        try:
+            index_file = IndexFile(path)
+            return DeviceIndex(index_file.names, index_file.load)
+        except (OSError, ValueError, struct.error, pickle.UnpicklingError):
+            pass
+
+    index = build_device_index(regice)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save_index_file(path, index)
+    except OSError:
+        pass
+    return index
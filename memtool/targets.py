@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class ThreadOutput:
+    """
+        A sys.stdout replacement that captures the output of some threads
+
+        Threads that set a buffer (see capture()) write to it, other
+        threads write to the original stdout.
+    """
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self.stdout, name)
+
+    def capture(self, buffer):
+        """
+            Redirect the output of the current thread
+
+            :param buffer: A file-like object, or None to stop capturing
+        """
+        self.local.buffer = buffer
+
+    def write(self, text):
+        return (getattr(self.local, 'buffer', None) or self.stdout).write(text)
+
+    def flush(self):
+        (getattr(self.local, 'buffer', None) or self.stdout).flush()
+
+def run_on_target(output, target, command):
+    """
+        Run a command on a target, capturing its output
+
+        :param output: The ThreadOutput installed as sys.stdout
+        :param target: The MemtoolPrompt of the target
+        :param command: The command line
+        :return: A tuple (error, data, text), where error is None on success
+    """
+    buffer = io.StringIO()
+    output.capture(buffer)
+    strict = target.strict
+    target.strict = True
+    try:
+        data = target.onecmd(command, local=True)
+        return None, data[1] if data else None, buffer.getvalue()
+    except SyntaxWarning as ex:
+        return str(ex), None, buffer.getvalue()
+    finally:
+        target.strict = strict
+        output.capture(None)
+
+def run_on_targets(targets, command):
+    """
+        Run a command concurrently on several targets
+
+        Each target runs in its own thread, so the whole run takes about
+        the time of the slowest target. The output of each target is captured,
+        and must be displayed by the caller.
+
+        :param targets: A dictionary of MemtoolPrompt, indexed by target name
+        :param command: The command line
+        :return: A dictionary of tuple (error, data, text), indexed by target name
+    """
+    output = ThreadOutput(sys.stdout)
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=max(len(targets), 1)) as executor:
+            futures = {name: executor.submit(run_on_target, output, targets[name], command)
+                       for name in targets}
+            return {name: futures[name].result() for name in targets}
+    finally:
+        sys.stdout = output.stdout
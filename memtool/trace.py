@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import mmap
+import struct
+import threading
+import time
+from array import array
+
+from memtool.wrapper import ClientWrapper
+
+TRACE_MAGIC = b'MTTRACE1'
+TRACE_RECORD = struct.Struct('<BBHdQQ')
+
+TRACE_READ = 0
+TRACE_WRITE = 1
+TRACE_COMMAND = 2
+
+class TraceWriter:
+    """
+        An append-only log of target accesses
+
+        The file starts with a magic, followed by fixed size records:
+        kind, width, command id, timestamp, address and value, little endian.
+        Command names are stored once per session, as a TRACE_COMMAND record
+        whose value is the length of the name that follows it.
+        Records are buffered, and only written to the file when the buffer
+        is full or when the trace is flushed or closed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(TRACE_MAGIC)
+        else:
+            with open(path, 'rb') as trace_file:
+                if trace_file.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+                    self.file.close()
+                    raise SyntaxWarning("Invalid trace file " + path)
+        self.commands = {}
+        self.lock = threading.Lock()
+
+    def get_command_id(self, command):
+        command = command or ''
+        command_id = self.commands.get(command)
+        if command_id is None:
+            command_id = self.commands[command] = len(self.commands)
+            name = command.encode()
+            self.file.write(TRACE_RECORD.pack(TRACE_COMMAND, 0, command_id,
+                                              time.time(), 0, len(name)))
+            self.file.write(name)
+        return command_id
+
+    def add(self, write, width, address, values, command):
+        """
+            Append target accesses to the trace
+
+            :param write: True for a write, False for a read
+            :param width: The width of the access, in bits
+            :param address: The address of the first access
+            :param values: The values read or written, at consecutive addresses
+            :param command: The name of the command that did the accesses
+        """
+        kind = TRACE_WRITE if write else TRACE_READ
+        timestamp = time.time()
+        step = width // 8
+        with self.lock:
+            command_id = self.get_command_id(command)
+            self.file.write(b''.join(
+                TRACE_RECORD.pack(kind, width, command_id, timestamp,
+                                  address + i * step, value)
+                for i, value in enumerate(values)))
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class RecordingClient(ClientWrapper):
+    """
+        A regice client wrapper that logs every target access to a trace
+
+        Accesses are attributed to the command being executed, as tracked by
+        the TransactionStats of the prompt.
+    """
+    def __init__(self, client, trace, stats):
+        super(RecordingClient, self).__init__(client)
+        self.trace = trace
+        self.stats = stats
+
+    def read(self, width, address):
+        value = self.client.read(width, address)
+        self.trace.add(False, width, address, (value,), self.stats.command)
+        return value
+
+    def write(self, width, address, value):
+        self.client.write(width, address, value)
+        self.trace.add(True, width, address, (value,), self.stats.command)
+
+    def _read_burst(self, width, address, count):
+        values = self.client.read_burst(width, address, count)
+        self.trace.add(False, width, address, values, self.stats.command)
+        return values
+
+    def _write_burst(self, width, address, values):
+        self.client.write_burst(width, address, values)
+        self.trace.add(True, width, address, values, self.stats.command)
+
+def read_trace(buf):
+    """
+        Decode the records of a trace
+
+        :param buf: The content of the trace file, e.g. a mmap
+        :return: A generator of tuple (offset, kind, width, command, timestamp,
+                 address, value). offset is the position of the record in buf.
+                 TRACE_COMMAND records are decoded, and not returned.
+    """
+    if buf[:len(TRACE_MAGIC)] != TRACE_MAGIC:
+        raise SyntaxWarning("Invalid trace file")
+    commands = {}
+    offset = len(TRACE_MAGIC)
+    end = len(buf) - TRACE_RECORD.size
+    while offset <= end:
+        kind, width, command_id, timestamp, address, value = \
+            TRACE_RECORD.unpack_from(buf, offset)
+        if kind == TRACE_COMMAND:
+            start = offset + TRACE_RECORD.size
+            commands[command_id] = bytes(buf[start:start + value]).decode()
+            offset = start + value
+            continue
+        yield (offset, kind, width, commands.get(command_id, ''), timestamp,
+               address, value)
+        offset += TRACE_RECORD.size
+
+class ReplayClient:
+    """
+        A regice client that serves reads from a trace
+
+        It can be used in place of RegiceClientTest, to run commands against
+        the state recorded from a real target. Each read of an address
+        returns the next value read from that address in the trace. Once
+        they have all been returned, or after a write, the last value read or
+        written is returned again.
+
+        The trace is memory mapped: only the offsets of the reads are indexed,
+        values are decoded on demand.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as trace_file:
+            self.buf = mmap.mmap(trace_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.reads = {}
+        self.position = {}
+        self.memory = {}
+        for offset, kind, _width, _command, _timestamp, address, _value in \
+                read_trace(self.buf):
+            if kind == TRACE_READ:
+                offsets = self.reads.get(address)
+                if offsets is None:
+                    offsets = self.reads[address] = array('Q')
+                offsets.append(offset)
+
+    def read(self, width, address):
+        offsets = self.reads.get(address, ())
+        position = self.position.get(address, 0)
+        if position < len(offsets):
+            self.position[address] = position + 1
+            value = TRACE_RECORD.unpack_from(self.buf, offsets[position])[5]
+            self.memory[address] = value
+            return value
+        if address not in self.memory:
+            raise SyntaxWarning("No value recorded at 0x{:08x}".format(address))
+        return self.memory[address]
+
+    def write(self, width, address, value):
+        self.position[address] = len(self.reads.get(address, ()))
+        self.memory[address] = value
+
+    def close(self):
+        self.buf.close()
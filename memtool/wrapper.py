@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+class ClientWrapper:
+    """
+        Base class of the regice client wrappers
+
+        Any attribute not defined by the wrapper is looked up in the wrapped
+        client. Subclasses override read() and write(), and _read_burst()
+        and _write_burst() for block transfers. The block transfer methods
+        (read_burst, write_burst) are only provided if the wrapped client
+        provides them.
+    """
+    def __init__(self, client):
+        self.client = client
+        if hasattr(client, 'read_burst'):
+            self.read_burst = self._read_burst
+        if hasattr(client, 'write_burst'):
+            self.write_burst = self._write_burst
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def read(self, width, address):
+        return self.client.read(width, address)
+
+    def write(self, width, address, value):
+        self.client.write(width, address, value)
+
+    def _read_burst(self, width, address, count):
+        return self.client.read_burst(width, address, count)
+
+    def _write_burst(self, width, address, values):
+        self.client.write_burst(width, address, values)
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+from libregice import Regice, RegiceClientTest
+from memtool.memtool import MemtoolPrompt
+from memtool.wrapper import ClientWrapper
+from regicecommon.helpers import load_svd
+
+def busy_wait(duration):
+    """
+        Wait without sleeping, to get accurate sub-millisecond delays
+
+        :param duration: The time to wait, in seconds
+    """
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        pass
+
+class LatencyClient(ClientWrapper):
+    """
+        A regice client wrapper that adds a fixed latency to every transaction
+
+        Set bursts to simulate block transfers on the memory of
+        a RegiceClientTest that does not provide them. A block transfer costs
+        a single latency, as it would on a real debug link.
+    """
+    def __init__(self, client, latency, bursts=False):
+        super(LatencyClient, self).__init__(client)
+        self.latency = latency
+        if bursts:
+            self.read_burst = self._read_burst
+            self.write_burst = self._write_burst
+
+    def read(self, width, address):
+        busy_wait(self.latency)
+        return self.client.read(width, address)
+
+    def write(self, width, address, value):
+        busy_wait(self.latency)
+        self.client.write(width, address, value)
+
+    def _read_burst(self, width, address, count):
+        busy_wait(self.latency)
+        if hasattr(self.client, 'read_burst'):
+            return self.client.read_burst(width, address, count)
+        step = width // 8
+        return [self.client.memory.get(address + i * step, 0) for i in range(count)]
+
+    def _write_burst(self, width, address, values):
+        busy_wait(self.latency)
+        if hasattr(self.client, 'write_burst'):
+            self.client.write_burst(width, address, values)
+            return
+        step = width // 8
+        for i, value in enumerate(values):
+            self.client.memory[address + i * step] = value
+
+def generate_svd(path, peripherals, registers, fields):
+    """
+        Generate a synthetic SVD file
+
+        Each peripheral has the same number of 32 bits registers, and each
+        register the same number of fields, evenly splitting the register.
+
+        :param path: The path of the SVD file to generate
+        :param peripherals: The number of peripherals
+        :param registers: The number of registers per peripheral
+        :param fields: The number of fields per register
+        :return: The list of all the register addresses
+    """
+    addresses = []
+    width = 32 // fields
+    with open(path, 'w') as svd:
+        svd.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        svd.write('<device><name>BENCH</name><width>32</width><size>32</size>'
+                  '<peripherals>\n')
+        for peripheral in range(peripherals):
+            base_address = 0x40000000 + peripheral * 0x10000
+            svd.write('<peripheral><name>P{}</name><baseAddress>0x{:x}</baseAddress>'
+                      '<registers>\n'.format(peripheral, base_address))
+            for register in range(registers):
+                addresses.append(base_address + register * 4)
+                svd.write('<register><name>R{}</name><addressOffset>0x{:x}</addressOffset>'
+                          '<size>32</size><access>read-write</access>'
+                          '<resetValue>0</resetValue><fields>'.format(register, register * 4))
+                for field in range(fields):
+                    svd.write('<field><name>F{}</name><bitOffset>{}</bitOffset>'
+                              '<bitWidth>{}</bitWidth></field>'.format(
+                                  field, field * width, width))
+                svd.write('</fields></register>\n')
+            svd.write('</registers></peripheral>\n')
+        svd.write('</peripherals></device>\n')
+    return addresses
+
+BENCHMARKS = [
+    ('baseAddress', "peripheral P0 baseAddress"),
+    ('read', "peripheral P0 read R1"),
+    ('read field', "peripheral P0 read R1.F1"),
+    ('write', "peripheral P0 write R1 1"),
+    ('write field', "peripheral P0 write R1.F1 1"),
+    ('dump', "peripheral P0 dump"),
+    ('dump -v', "peripheral P0 dump -v"),
+    ('peripherals list', "peripherals list"),
+]
+
+def run_benchmark(prompt, command, iterations):
+    """
+        Run a command several times, and measure it
+
+        The command is run once before measuring, to build the indexes.
+        Allocations are measured on a separate run, as tracing them
+        slows down the commands.
+
+        :param prompt: The MemtoolPrompt to use
+        :param command: The command to run
+        :param iterations: The number of times to run the command
+        :return: A dictionary with the mean time per command (seconds),
+                 the number of transactions per command, and the peak
+                 memory allocated while running the command (bytes)
+    """
+    prompt.onecmd(command)
+    prompt.stats.reset()
+    start = time.perf_counter()
+    for _i in range(iterations):
+        prompt.onecmd(command)
+    elapsed = time.perf_counter() - start
+    transactions = sum(stats.reads + stats.writes
+                       for stats in prompt.stats.commands.values())
+
+    tracemalloc.start()
+    prompt.onecmd(command)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'time': elapsed / iterations,
+        'transactions': transactions / iterations,
+        'allocated': peak,
+    }
+
+def run_benchmarks(peripherals, registers, fields, latency, iterations,
+                   bursts=False):
+    """
+        Run all the benchmarks against a synthetic SVD
+
+        :param peripherals: The number of peripherals of the synthetic SVD
+        :param registers: The number of registers per peripheral
+        :param fields: The number of fields per register
+        :param latency: The latency of each transaction, in seconds
+        :param iterations: The number of times to run each command
+        :param bursts: Set to True to simulate a client with block transfers
+        :return: A dictionary of results, indexed by benchmark name
+    """
+    with tempfile.TemporaryDirectory() as svd_dir:
+        path = os.path.join(svd_dir, 'bench.svd')
+        addresses = generate_svd(path, peripherals, registers, fields)
+        client = RegiceClientTest()
+        client.memory.update({address: 0 for address in addresses})
+        regice = Regice(LatencyClient(client, latency, bursts), load_svd(path))
+    prompt = MemtoolPrompt(regice)
+    prompt.test = True
+    results = {}
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        for name, command in BENCHMARKS:
+            results[name] = run_benchmark(prompt, command, iterations)
+    return results
+
+def compare(results, baseline, threshold):
+    """
+        Compare results against a baseline
+
+        :param results: The results of run_benchmarks()
+        :param baseline: The results of a previous run
+        :param threshold: The relative increase of time or allocated memory
+                          above which a benchmark is considered to regress.
+                          Any increase of the number of transactions is
+                          a regression.
+        :return: A list of messages, one per regression
+    """
+    regressions = []
+    for name in results:
+        if name not in baseline:
+            continue
+        result = results[name]
+        base = baseline[name]
+        if result['transactions'] > base['transactions']:
+            regressions.append("{}: {} transactions, was {}".format(
+                name, result['transactions'], base['transactions']))
+        for metric in ('time', 'allocated'):
+            if result[metric] > base[metric] * (1 + threshold):
+                regressions.append("{}: {} {:.6g}, was {:.6g}".format(
+                    name, metric, result[metric], base[metric]))
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark memtool commands')
+    parser.add_argument('--peripherals', type=int, default=20)
+    parser.add_argument('--registers', type=int, default=200,
+                        help='Number of registers per peripheral')
+    parser.add_argument('--fields', type=int, default=4,
+                        help='Number of fields per register')
+    parser.add_argument('--latency', type=float, default=100,
+                        help='Latency of each transaction, in microseconds')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--bursts', action='store_true',
+                        help='Simulate a client with block transfers')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='Compare the results against a baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative regression threshold (default 0.2)')
+    parser.add_argument('--save', metavar='FILE',
+                        help='Save the results, to be used as a baseline')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.peripherals, args.registers, args.fields,
+                             args.latency / 1000000, args.iterations,
+                             args.bursts)
+    print("{:<20} {:>12} {:>12} {:>14} {:>12}".format(
+        "benchmark", "time (ms)", "commands/s", "transactions", "allocated"))
+    for name in results:
+        result = results[name]
+        print("{:<20} {:>12.3f} {:>12.0f} {:>14.1f} {:>12}".format(
+            name, result['time'] * 1000, 1 / result['time'],
+            result['transactions'], result['allocated']))
+
+    if args.save:
+        with open(args.save, 'w') as save:
+            json.dump(results, save, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -23,13 +23,78 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import io
+import json
+import os
 import sys
+import tempfile
+import threading
+import time
 import unittest
+from contextlib import redirect_stdout
 
 from libregice import Regice, RegiceClientTest
-from memtool.memtool import MemtoolPrompt
+from memtool.burst import plan_bursts
+from memtool.client import MemtoolClient
+from memtool.logger import read_log
+from memtool.memtool import MemtoolPeripheralPrompt, MemtoolPrompt
+from memtool.mmapclient import MmapClient, get_peripheral_regions
+from memtool.server import MemtoolServer
+from memtool.svdindex import (DeviceIndex, FieldInfo, PeripheralIndex,
+                              RegisterInfo, load_device_index)
+from memtool.targets import ThreadOutput
+from memtool.trace import (TRACE_READ, TRACE_WRITE, ReplayClient, TraceWriter,
+                           read_trace)
 from regicecommon.helpers import load_svd
 
+class BurstClient:
+    """
+        A test client that provides block transfers, and logs all the accesses
+    """
+    def __init__(self, memory):
+        self.memory = memory
+        self.accesses = []
+
+    def read(self, width, address):
+        self.accesses.append(('read', address, 1))
+        return self.memory[address]
+
+    def write(self, width, address, value):
+        self.accesses.append(('write', address, 1))
+        self.memory[address] = value
+
+    def read_burst(self, width, address, count):
+        self.accesses.append(('read_burst', address, count))
+        return [self.memory[address + i * width // 8] for i in range(count)]
+
+    def write_burst(self, width, address, values):
+        self.accesses.append(('write_burst', address, len(values)))
+        for i, value in enumerate(values):
+            self.memory[address + i * width // 8] = value
+
+    def read_addresses(self):
+        """
+            :return: The set of all the addresses read, including by bursts
+        """
+        return {address + i * 4 for kind, address, count in self.accesses
+                if kind.startswith('read') for i in range(count)}
+
+def get_hazard_index():
+    """
+        Build the index of a peripheral P with registers A, FIFO, C and CTRL,
+        where reading FIFO and CTRL (fields EN and MODE) has side effects
+        (readAction)
+    """
+    registers = {name: RegisterInfo(name, 0x1000 + offset, 32, None,
+                                    name == 'FIFO', {})
+                 for name, offset in (('A', 0), ('FIFO', 4), ('C', 8))}
+    registers['CTRL'] = RegisterInfo('CTRL', 0x10f0, 32, None, True, {
+        'EN': FieldInfo('EN', 0, 1, None, None),
+        'MODE': FieldInfo('MODE', 1, 31, None, None),
+    })
+    peripheral = PeripheralIndex('P', 0x1000, registers)
+    return DeviceIndex(['P'], lambda name: peripheral)
+
 class TestRegicePrompt(unittest.TestCase):
     @classmethod
     def setUpClass(self):
@@ -41,6 +106,7 @@ class TestRegicePrompt(unittest.TestCase):
 
     def setUp(self):
         self.regice.client.memory_restore()
+        self.cmd.onecmd("cache off")
 
     def test_quit(self):
         exit, data = self.cmd.onecmd("quit")
@@ -72,6 +138,23 @@ class TestRegicePrompt(unittest.TestCase):
         with self.assertRaises(SyntaxWarning):
             self.cmd.onecmd("peripheral TEST1 read TESTA.A4")
 
+    def test_peripheral_read_single_access(self):
+        reads = []
+        read = self.regice.client.read
+        def count_read(width, address):
+            reads.append(address)
+            return read(width, address)
+        self.regice.client.read = count_read
+        try:
+            self.cmd.onecmd("peripheral TEST1 read TESTA.A3")
+            self.assertEqual(len(reads), 1)
+            self.cmd.onecmd("peripheral TEST1 read -v TESTA")
+            self.assertEqual(len(reads), 2)
+            self.cmd.onecmd("peripheral TEST1 dump -v")
+            self.assertEqual(len(reads), 4)
+        finally:
+            del self.regice.client.read
+
     def test_peripheral_write(self):
         expected = 9
         exit, value = self.cmd.onecmd("peripheral TEST1 write TESTA " + str(expected))
@@ -81,6 +164,10 @@ class TestRegicePrompt(unittest.TestCase):
         exit, value = self.cmd.onecmd("peripheral TEST1 write TESTA.A3 " + str(expected))
         self.assertEqual(value, expected)
 
+        expected = 1
+        exit, value = self.cmd.onecmd("peripheral TEST1 write -V TESTA.A3 0x1")
+        self.assertEqual(value, expected)
+
         with self.assertRaises(SyntaxWarning):
             self.cmd.onecmd("peripheral TEST1 write")
 
@@ -93,6 +180,23 @@ class TestRegicePrompt(unittest.TestCase):
         with self.assertRaises(SyntaxWarning):
             self.cmd.onecmd("peripheral TEST1 write TESTA.A4 0")
 
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripheral TEST1 write TESTA.A3 4")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripheral TEST1 write TESTA foo")
+
+        exit, value = self.cmd.onecmd("peripheral TEST1 write TESTA 010")
+        self.assertEqual(value, 10)
+        self.assertEqual(self.memory[0x00001234], 10)
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripheral TEST1 write TESTA 0x1ffffffff")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripheral TEST1 write TESTA -1")
+        self.assertEqual(self.memory[0x00001234], 10)
+
     def test_peripheral_dump(self):
         expected = {'TESTA' : self.memory[0x00001234]}
         exit, value = self.cmd.onecmd("peripheral TEST1 dump TESTA")
@@ -124,6 +228,603 @@ class TestRegicePrompt(unittest.TestCase):
         with self.assertRaises(SyntaxWarning):
             self.cmd.onecmd("peripheral TEST1 dump TESTC")
 
+    def test_peripheral_dump_burst(self):
+        registers = self.cmd.get_index('TEST1').registers.values()
+        self.assertEqual(len(plan_bursts(registers, 0, 1024)), 1)
+        self.assertEqual(len(plan_bursts(registers, 0, 4)), 2)
+
+        expected = {
+            'TESTA' : self.memory[0x00001234],
+            'TESTB' : self.memory[0x00001238],
+        }
+        exit, value = self.cmd.onecmd("peripheral TEST1 dump -g 0 -m 4")
+        self.assertEqual(value, expected)
+
+        expected = {
+            'TESTA': {'A1': 0, 'A2': 1, 'A3': 3},
+            'TESTB': {'B1': 1, 'B2': 0, 'B3': 0},
+        }
+        exit, value = self.cmd.onecmd("peripheral TEST1 dump -g 0 -v")
+        self.assertEqual(value, expected)
+        with redirect_stdout(io.StringIO()):
+            exit, value = self.cmd.onecmd("peripheral TEST1 dump -v -f jsonl -m 4")
+        self.assertEqual(value, expected)
+        exit, value = self.cmd.onecmd("dump -v -f text TEST1")
+        self.assertEqual(value['TEST1.TESTB'], expected['TESTB'])
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripheral TEST1 dump -g")
+
+        client = BurstClient(dict(self.memory))
+        prompt = MemtoolPrompt(Regice(client, load_svd('test.svd')), self.cmd.index)
+        prompt.test = True
+        prompt.onecmd("peripheral TEST1 dump")
+        self.assertEqual(client.accesses, [('read_burst', 0x00001234, 2)])
+
+        client = BurstClient({0x1000: 1, 0x1004: 2, 0x1008: 3})
+        prompt = MemtoolPrompt(Regice(client, load_svd('test.svd')),
+                               get_hazard_index())
+        prompt.test = True
+        exit, value = prompt.onecmd("peripheral P dump A C")
+        self.assertEqual(value, {'A': 1, 'C': 3})
+        self.assertEqual(client.accesses, [('read', 0x1000, 1), ('read', 0x1008, 1)])
+
+    def test_cache(self):
+        self.cmd.onecmd("cache on")
+        self.cmd.onecmd("peripheral TEST1 read TESTA")
+        self.memory[0x00001234] = 0
+        exit, value = self.cmd.onecmd("peripheral TEST1 read TESTA")
+        self.assertNotEqual(value, 0)
+        exit, stats = self.cmd.onecmd("cache stats")
+        self.assertEqual(stats['hits'], 1)
+
+        self.cmd.onecmd("peripheral TEST1 write TESTA 5")
+        exit, value = self.cmd.onecmd("peripheral TEST1 dump TESTA")
+        self.assertEqual(value, {'TESTA': 5})
+
+        self.memory[0x00001234] = 0
+        self.cmd.onecmd("cache flush TEST1")
+        exit, value = self.cmd.onecmd("peripheral TEST1 read TESTA")
+        self.assertEqual(value, 0)
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("cache")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("cache flush TEST4")
+
+    def test_peripheral_sessions(self):
+        session = self.cmd.get_session('TEST1')
+        self.assertIs(self.cmd.get_session('TEST1'), session)
+        exit, value = self.cmd.onecmd("peripheral TEST1 read TESTA")
+        self.assertEqual(value, self.memory[0x00001234])
+
+        self.cmd.sessions_max = 1
+        try:
+            self.cmd.get_session('TEST2')
+            self.assertEqual(list(self.cmd.sessions), ['TEST2'])
+            self.assertIsNot(self.cmd.get_session('TEST1'), session)
+        finally:
+            del self.cmd.sessions_max
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripheral TEST1 read TESTC")
+
+    def test_peripheral_watch(self):
+        exit, samples = self.cmd.onecmd("peripheral TEST1 watch -n 3 TESTA TESTB.B1")
+        self.assertEqual(len(samples), 3)
+        self.assertEqual(samples[0][1], (self.memory[0x00001234], 1))
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            output = os.path.join(output_dir, 'watch.csv')
+            self.cmd.onecmd("peripheral TEST1 watch -n 2 -o {} TESTA".format(output))
+            with open(output) as samples_file:
+                self.assertEqual(len(samples_file.readlines()), 3)
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripheral TEST1 watch -n 1")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripheral TEST1 watch -i foo TESTA")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripheral TEST1 watch TESTA.A4")
+
+    def test_peripheral_waitfor(self):
+        exit, value = self.cmd.onecmd("peripheral TEST1 waitfor TESTA.A3 == 3")
+        self.assertEqual(value, 3)
+
+        exit, value = self.cmd.onecmd("peripheral TEST1 waitfor TESTA & 0x2")
+        self.assertEqual(value, self.memory[0x00001234])
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripheral TEST1 waitfor TESTA.A3 != 3 --timeout 0.01")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripheral TEST1 waitfor TESTA.A3 < 3")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripheral TEST1 waitfor TESTA.A3 == 3 --timeout")
+
+    def test_peripheral_complete(self):
+        cmd = MemtoolPeripheralPrompt(self.cmd, 'TEST1')
+        self.assertEqual(cmd.complete_read('TEST', 'read TEST', 5, 9),
+                         ['TESTA', 'TESTB'])
+        self.assertEqual(cmd.complete_write('TESTA.A', 'write TESTA.A', 6, 13),
+                         ['TESTA.A1', 'TESTA.A2', 'TESTA.A3'])
+        self.assertEqual(cmd.complete_dump('TESTC', 'dump TESTC', 5, 10), [])
+        self.assertEqual(self.cmd.complete_peripheral('TEST', 'peripheral TEST', 11, 15),
+                         ['TEST1', 'TEST2'])
+
+    def test_batch(self):
+        self.cmd.onecmd("batch begin")
+        self.cmd.onecmd("peripheral TEST1 write TESTA 0")
+        self.cmd.onecmd("peripheral TEST1 write TESTA.A3 2")
+        self.cmd.onecmd("peripheral TEST1 write TESTB 0")
+        self.assertEqual(self.memory[0x00001238], 1)
+        exit, written = self.cmd.onecmd("batch commit")
+        self.assertEqual(written, 2)
+        exit, value = self.cmd.onecmd("peripheral TEST1 read -v TESTA")
+        self.assertEqual(value, {'A1': 0, 'A2': 0, 'A3': 2})
+        self.assertEqual(self.memory[0x00001238], 0)
+
+        self.cmd.onecmd("batch begin")
+        self.cmd.onecmd("peripheral TEST1 write TESTB 1")
+        self.cmd.onecmd("batch abort")
+        self.assertEqual(self.memory[0x00001238], 0)
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("batch commit")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("batch")
+
+    def test_run_commands(self):
+        commands = [
+            "# comment",
+            "batch begin",
+            "peripheral TEST1 write TESTB 0",
+            "",
+            "batch commit",
+        ]
+        self.assertTrue(self.cmd.run_commands(commands))
+        self.assertEqual(self.memory[0x00001238], 0)
+
+        self.assertFalse(self.cmd.run_commands(["peripheral TEST1 read TESTC"]))
+        self.assertFalse(self.cmd.run_commands(["batch begin"]))
+        self.assertIsNone(self.cmd.batch)
+        self.assertFalse(self.cmd.run_commands(["foo"]))
+
+    def test_snapshot(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            good = os.path.join(snapshot_dir, 'good.snap')
+            exit, count = self.cmd.onecmd("snapshot save " + good)
+            self.assertTrue(count >= 2)
+
+            exit, diffs = self.cmd.onecmd("snapshot diff {} live".format(good))
+            self.assertEqual(diffs, [])
+
+            self.cmd.onecmd("peripheral TEST1 write TESTB 0")
+            exit, diffs = self.cmd.onecmd("snapshot diff {} live".format(good))
+            self.assertEqual(diffs, [('TEST1.TESTB', 1, 0)])
+
+            exit, count = self.cmd.onecmd("snapshot restore " + good)
+            self.assertEqual(count, 1)
+            self.assertEqual(self.memory[0x00001238], 1)
+
+            with self.assertRaises(SyntaxWarning):
+                self.cmd.onecmd("snapshot restore " + os.path.join(snapshot_dir, 'none'))
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("snapshot diff")
+
+    def test_apply(self):
+        with tempfile.TemporaryDirectory() as config_dir:
+            path = os.path.join(config_dir, 'config.json')
+            with open(path, 'w') as config:
+                json.dump({'TEST1': {'TESTA.A1': 1, 'TESTA.A3': '3', 'TESTB': 1}},
+                          config)
+            exit, changes = self.cmd.onecmd("apply -n " + path)
+            self.assertEqual(changes, [('TEST1.TESTA', 14, 15)])
+            self.assertEqual(self.memory[0x00001234], 14)
+
+            self.cmd.onecmd("stats reset")
+            exit, changes = self.cmd.onecmd("apply " + path)
+            self.assertEqual(changes, [('TEST1.TESTA', 14, 15)])
+            self.assertEqual(self.memory[0x00001234], 15)
+            exit, stats = self.cmd.onecmd("stats")
+            self.assertEqual(stats['apply']['writes'], 1)
+
+            exit, changes = self.cmd.onecmd("apply " + path)
+            self.assertEqual(changes, [])
+
+            path = os.path.join(config_dir, 'config.ini')
+            with open(path, 'w') as config:
+                config.write("[TEST1]\nTESTB.B1 = 0\nTESTA = 0x2\n")
+            exit, changes = self.cmd.onecmd("apply " + path)
+            self.assertEqual(changes, [('TEST1.TESTA', 15, 2), ('TEST1.TESTB', 1, 0)])
+            self.assertEqual(self.memory[0x00001238], 0)
+
+            path = os.path.join(config_dir, 'invalid.json')
+            with open(path, 'w') as config:
+                json.dump({'TEST1.TESTC': 1}, config)
+            with self.assertRaises(SyntaxWarning):
+                self.cmd.onecmd("apply " + path)
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("apply")
+
+    def test_apply_hazards(self):
+        client = BurstClient({0x1000: 1, 0x1004: 2, 0x1008: 3})
+        prompt = MemtoolPrompt(Regice(client, load_svd('test.svd')),
+                               get_hazard_index())
+        prompt.test = True
+        with tempfile.TemporaryDirectory() as config_dir:
+            path = os.path.join(config_dir, 'config.json')
+            with open(path, 'w') as config:
+                json.dump({'P.A': 1, 'P.FIFO': 2}, config)
+            exit, changes = prompt.onecmd("apply -n " + path)
+            self.assertEqual(changes, [('P.FIFO', None, 2)])
+            exit, changes = prompt.onecmd("apply " + path)
+            self.assertEqual(changes, [('P.FIFO', None, 2)])
+        self.assertNotIn(0x1004, client.read_addresses())
+        self.assertIn(('write', 0x1004, 1), client.accesses)
+
+        with tempfile.TemporaryDirectory() as config_dir:
+            path = os.path.join(config_dir, 'config.json')
+            with open(path, 'w') as config:
+                json.dump({'P.CTRL.EN': 1}, config)
+            with self.assertRaises(SyntaxWarning):
+                prompt.onecmd("apply -n " + path)
+            with self.assertRaises(SyntaxWarning):
+                prompt.onecmd("apply " + path)
+
+            with open(path, 'w') as config:
+                json.dump({'P.CTRL.EN': 1, 'P.CTRL.MODE': 2}, config)
+            exit, changes = prompt.onecmd("apply " + path)
+            self.assertEqual(changes, [('P.CTRL', None, 5)])
+        self.assertNotIn(0x10f0, client.read_addresses())
+
+    def test_memory(self):
+        exit, length = self.cmd.onecmd("md 0x1234 8")
+        self.assertEqual(length, 8)
+
+        self.cmd.onecmd("mw 0x1234 5 6")
+        self.assertEqual(self.memory[0x00001234], 5)
+        self.assertEqual(self.memory[0x00001238], 6)
+
+        self.cmd.onecmd("mfill 0x1234 8 0xa")
+        self.assertEqual(self.memory[0x00001234], 0xa)
+        self.assertEqual(self.memory[0x00001238], 0xa)
+
+        with tempfile.TemporaryDirectory() as memory_dir:
+            path = os.path.join(memory_dir, 'memory.bin')
+            self.cmd.onecmd("mw 0x1238 7")
+            self.cmd.onecmd("msave 0x1234 8 " + path)
+            with open(path, 'rb') as memory_file:
+                self.assertEqual(memory_file.read(), bytes([0xa, 0, 0, 0, 7, 0, 0, 0]))
+            self.cmd.onecmd("mfill 0x1234 8 0")
+            self.cmd.onecmd("mload 0x1234 8 " + path)
+            self.assertEqual(self.memory[0x00001234], 0xa)
+            self.assertEqual(self.memory[0x00001238], 7)
+
+            with self.assertRaises(SyntaxWarning):
+                self.cmd.onecmd("mload 0x1234 16 " + path)
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("md 0x1235 4")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("md -w 12 0x1234 4")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("mw -w 8 0x1234 256")
+
+    def test_stats(self):
+        self.cmd.onecmd("stats reset")
+        self.cmd.onecmd("peripheral TEST1 read TESTA")
+        self.cmd.onecmd("peripheral TEST1 write TESTA 1")
+        exit, stats = self.cmd.onecmd("stats")
+        self.assertEqual(stats['read']['reads'], 1)
+        self.assertEqual(stats['read']['calls'], 1)
+        self.assertEqual(stats['write']['writes'], 1)
+        self.assertEqual(stats['write']['reads'], 0)
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("stats foo")
+
+        client = self.regice.client
+        prompt = MemtoolPrompt(self.regice)
+        prompt.test = True
+        self.assertIs(self.regice.client, client)
+        self.cmd.onecmd("stats reset")
+        prompt.onecmd("peripheral TEST1 read TESTA")
+        exit, stats = prompt.onecmd("stats")
+        self.assertEqual(stats['read']['reads'], 1)
+        exit, stats = self.cmd.onecmd("stats")
+        self.assertEqual(stats, {'stats': stats['stats']})
+
+    def test_record(self):
+        with tempfile.TemporaryDirectory() as trace_dir:
+            path = os.path.join(trace_dir, 'trace')
+            regice = Regice(RegiceClientTest(), load_svd('test.svd'))
+            prompt = MemtoolPrompt(regice)
+            prompt.test = True
+            trace = TraceWriter(path)
+            prompt.record(trace)
+            prompt.onecmd("peripheral TEST1 read TESTA")
+            prompt.onecmd("peripheral TEST1 write TESTA 5")
+            prompt.onecmd("peripheral TEST1 read TESTA")
+            trace.close()
+
+            with open(path, 'rb') as trace_file:
+                records = list(read_trace(trace_file.read()))
+            self.assertEqual([(record[1], record[3], record[5], record[6])
+                              for record in records],
+                             [(TRACE_READ, 'read', 0x1234, 14),
+                              (TRACE_WRITE, 'write', 0x1234, 5),
+                              (TRACE_READ, 'read', 0x1234, 5)])
+
+            client = ReplayClient(path)
+            replay = MemtoolPrompt(Regice(client, load_svd('test.svd')))
+            replay.test = True
+            exit, value = replay.onecmd("peripheral TEST1 read TESTA")
+            self.assertEqual(value, 14)
+            exit, value = replay.onecmd("peripheral TEST1 read TESTA")
+            self.assertEqual(value, 5)
+            exit, value = replay.onecmd("peripheral TEST1 read TESTA")
+            self.assertEqual(value, 5)
+            replay.onecmd("peripheral TEST1 write TESTA 7")
+            exit, value = replay.onecmd("peripheral TEST1 read TESTA")
+            self.assertEqual(value, 7)
+            with self.assertRaises(SyntaxWarning):
+                replay.onecmd("peripheral TEST1 read TESTB")
+            client.close()
+
+    def test_mmap(self):
+        with tempfile.TemporaryDirectory() as mmap_dir:
+            path = os.path.join(mmap_dir, 'memory')
+            with open(path, 'wb') as memory_file:
+                memory_file.truncate(0x20000)
+            client = MmapClient(path, get_peripheral_regions(self.cmd.index))
+            try:
+                client.write(32, 0x1234, 14)
+                client.write(32, 0x1238, 1)
+                prompt = MemtoolPrompt(Regice(client, load_svd('test.svd')),
+                                       self.cmd.index)
+                prompt.test = True
+                exit, value = prompt.onecmd("peripheral TEST1 read TESTA")
+                self.assertEqual(value, 14)
+                prompt.onecmd("peripheral TEST1 write TESTA.A1 1")
+                self.assertEqual(client.read(32, 0x1234), 15)
+                self.assertEqual(client.read_burst(32, 0x1234, 2), [15, 1])
+                client.write_burst(16, 0x1234, [2, 3])
+                self.assertEqual(client.read(32, 0x1234), 0x30002)
+                self.assertEqual(client.read(16, 0x1235), 0x300)
+
+                with self.assertRaises(SyntaxWarning):
+                    client.read(32, 0x10000000)
+            finally:
+                client.close()
+            with open(path, 'rb') as memory_file:
+                memory_file.seek(0x1238)
+                self.assertEqual(memory_file.read(4), b'\x01\x00\x00\x00')
+
+    def test_log(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            path = os.path.join(log_dir, 'soak.log')
+            self.cmd.onecmd("stats reset")
+            exit, count = self.cmd.onecmd(
+                "log start soak TEST1.TESTA TEST1.TESTB --period 5 --out " + path)
+            self.assertEqual(count, 2)
+            try:
+                with self.assertRaises(SyntaxWarning):
+                    self.cmd.onecmd("log start soak TEST1.TESTA --out " + path)
+                exit, logs = self.cmd.onecmd("log list")
+                self.assertEqual(logs, ['soak'])
+                while self.cmd.logs['soak'].writer.count < 2:
+                    time.sleep(0.005)
+                self.cmd.onecmd("peripheral TEST1 write TESTB 0")
+                count = self.cmd.logs['soak'].writer.count
+                while self.cmd.logs['soak'].writer.count < count + 2:
+                    time.sleep(0.005)
+            finally:
+                exit, count = self.cmd.onecmd("log stop soak")
+
+            exit, stats = self.cmd.onecmd("stats")
+            self.assertEqual(stats['log:soak']['reads'], 2 * count)
+            self.assertEqual(stats['write']['reads'], 0)
+            self.assertNotIn('', stats)
+
+            columns, timestamps, values = read_log(path)
+            self.assertEqual(columns, [('TEST1.TESTA', 0x1234, 32),
+                                       ('TEST1.TESTB', 0x1238, 32)])
+            self.assertEqual(len(timestamps), count)
+            self.assertEqual(values[0][0], 14)
+            self.assertEqual(values[1][0], 1)
+            self.assertEqual(values[1][-1], 0)
+            self.assertEqual(list(timestamps), sorted(timestamps))
+
+            with self.assertRaises(SyntaxWarning):
+                self.cmd.onecmd("log start soak TEST1.TESTA --period 0 --out " + path)
+            with self.assertRaises(SyntaxWarning):
+                self.cmd.onecmd("log start soak TEST1.TESTA")
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("log stop soak")
+
+    def test_log_hazards(self):
+        client = BurstClient({0x1000: 1, 0x1004: 2, 0x1008: 3})
+        prompt = MemtoolPrompt(Regice(client, load_svd('test.svd')),
+                               get_hazard_index())
+        prompt.test = True
+        with tempfile.TemporaryDirectory() as log_dir:
+            path = os.path.join(log_dir, 'hazards.log')
+            prompt.onecmd("log start x P.A P.C --period 1 --out " + path)
+            try:
+                while prompt.logs['x'].writer.count < 2:
+                    time.sleep(0.005)
+            finally:
+                prompt.onecmd("log stop x")
+            columns, timestamps, values = read_log(path)
+        self.assertEqual(values[0][0], 1)
+        self.assertEqual(values[1][0], 3)
+        self.assertNotIn(0x1004, client.read_addresses())
+
+    def test_server(self):
+        with tempfile.TemporaryDirectory() as socket_dir:
+            path = os.path.join(socket_dir, 'memtool.sock')
+            server = MemtoolServer(path, MemtoolPrompt(self.regice))
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                with MemtoolClient(path) as client:
+                    response = client.run("peripheral TEST1 read TESTA")
+                    self.assertTrue(response['ok'])
+                    self.assertEqual(response['result'], self.memory[0x00001234])
+                    self.assertTrue(response['output'].startswith("TESTA = 0x"))
+
+                    response = client.run("peripheral TEST1 read TESTC")
+                    self.assertFalse(response['ok'])
+
+                    response = client.run("peripheral TEST1")
+                    self.assertFalse(response['ok'])
+
+                    response = client.run("peripheral TEST1 watch TESTA")
+                    self.assertFalse(response['ok'])
+
+                    response = client.run("md 0x0 4")
+                    self.assertFalse(response['ok'])
+                    self.assertTrue(response['error'])
+                    response = client.run("peripheral TEST1 read TESTA")
+                    self.assertTrue(response['ok'])
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+            self.assertNotIsInstance(sys.stdout, ThreadOutput)
+
+    def test_targets(self):
+        regice = Regice(RegiceClientTest(), load_svd('test.svd'))
+        self.cmd.add_target('board2', regice)
+        try:
+            exit, targets = self.cmd.onecmd("target list")
+            self.assertEqual(targets, ['default', 'board2'])
+
+            self.cmd.onecmd("target select board2")
+            self.cmd.onecmd("peripheral TEST1 write TESTB 0")
+            self.assertEqual(self.memory[0x00001238], 1)
+            self.assertEqual(regice.client.memory[0x00001238], 0)
+
+            exit, values = self.cmd.onecmd("@all peripheral TEST1 read TESTB")
+            self.assertEqual(values, {'default': 1, 'board2': 0})
+
+            exit, values = self.cmd.onecmd("@board2 peripheral TEST1 read TESTB")
+            self.assertEqual(values, {'board2': 0})
+
+            with self.assertRaises(SyntaxWarning):
+                self.cmd.onecmd("@all peripheral TEST1 read TESTC")
+
+            with self.assertRaises(SyntaxWarning):
+                self.cmd.onecmd("@board3 peripherals list")
+
+            with self.assertRaises(SyntaxWarning):
+                self.cmd.onecmd("target select board3")
+
+            with self.assertRaises(SyntaxWarning):
+                self.cmd.onecmd("target add board2")
+
+            with tempfile.TemporaryDirectory() as log_dir:
+                path = os.path.join(log_dir, 'board2.log')
+                self.cmd.onecmd("log start board2 TEST1.TESTB --period 1 --out " + path)
+                target = self.cmd.targets['board2']
+                self.assertEqual(list(target.logs), ['board2'])
+                logger = target.logs['board2']
+                self.cmd.stop_logs()
+                self.assertEqual(target.logs, {})
+                self.assertFalse(logger.is_alive())
+                columns, timestamps, values = read_log(path)
+                self.assertEqual(len(timestamps), logger.writer.count)
+        finally:
+            self.cmd.onecmd("target select default")
+            del self.cmd.targets['board2']
+
+    def test_output_format(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.cmd.onecmd("peripheral TEST1 dump -f jsonl")
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([record['register'] for record in records], ['TESTA', 'TESTB'])
+        self.assertEqual(records[0]['value'], self.memory[0x00001234])
+        self.assertEqual(records[0]['address'], 0x00001234)
+
+        output = io.StringIO()
+        self.cmd.onecmd("format csv")
+        try:
+            with redirect_stdout(output):
+                self.cmd.onecmd("peripheral TEST1 read -v TESTA")
+        finally:
+            self.cmd.onecmd("format text")
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[3], "TEST1,TESTA,A3,0x1234,3")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripheral TEST1 read -f xml TESTA")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("format xml")
+
+    def test_selectors(self):
+        expected = {
+            'TEST1.TESTA': self.memory[0x00001234],
+            'TEST1.TESTB': self.memory[0x00001238],
+        }
+        exit, values = self.cmd.onecmd("dump 'TEST1.TEST*'")
+        self.assertEqual(values, expected)
+
+        exit, values = self.cmd.onecmd("dump TEST1")
+        self.assertEqual(values, expected)
+
+        exit, values = self.cmd.onecmd("dump -r TEST[1]\\.TESTA")
+        self.assertEqual(values, {'TEST1.TESTA': self.memory[0x00001234]})
+
+        exit, values = self.cmd.onecmd("read *.TESTA.A3 TEST1.TESTB.B1")
+        self.assertEqual(values, {'TEST1.TESTA.A3': 3, 'TEST1.TESTB.B1': 1})
+
+        exit, values = self.cmd.onecmd("read -r TEST1\\.TESTA\\.A[12]")
+        self.assertEqual(values, {'TEST1.TESTA.A1': 0, 'TEST1.TESTA.A2': 1})
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("dump TEST1.TESTC")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("dump TEST1.TESTA.A3")
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("dump -r TEST1[")
+
+        client = BurstClient(dict(self.memory))
+        prompt = MemtoolPrompt(Regice(client, load_svd('test.svd')), self.cmd.index)
+        prompt.test = True
+        prompt.burst_max = 4
+        output = prompt.get_output()
+        emit = output.emit
+        def log_emit(peripheral, name, *args, **kwargs):
+            client.accesses.append(('emit', name))
+            return emit(peripheral, name, *args, **kwargs)
+        output.emit = log_emit
+        exit, values = prompt.onecmd("read TEST1.TESTA.A3 TEST1.TESTB.B1 TEST1.TESTA.A1")
+        self.assertEqual(values, {'TEST1.TESTA.A3': 3, 'TEST1.TESTA.A1': 0,
+                                  'TEST1.TESTB.B1': 1})
+        self.assertEqual(client.accesses, [
+            ('read', 0x00001234, 1), ('emit', 'TEST1.TESTA.A3'),
+            ('emit', 'TEST1.TESTA.A1'), ('read', 0x00001238, 1),
+            ('emit', 'TEST1.TESTB.B1'),
+        ])
+
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("read")
+
     def test_peripheral_baseAddress(self):
         exit, value = self.cmd.onecmd("peripheral TEST1 baseAddress")
         self.assertEqual(value, 0x00001234)
@@ -136,9 +837,35 @@ class TestRegicePrompt(unittest.TestCase):
         exit, peripherals_list = self.cmd.onecmd("peripherals list")
         self.assertEqual(list(peripherals_list), expected)
 
+        exit, peripherals_list = self.cmd.onecmd("peripherals list -v")
+        self.assertEqual(list(peripherals_list), expected)
+
         with self.assertRaises(SyntaxWarning):
             self.cmd.onecmd("peripherals")
 
+        with self.assertRaises(SyntaxWarning):
+            self.cmd.onecmd("peripherals list -x")
+
+    def test_device_index(self):
+        saved = os.environ.get('XDG_CACHE_HOME')
+        with tempfile.TemporaryDirectory() as cache_dir:
+            os.environ['XDG_CACHE_HOME'] = cache_dir
+            try:
+                index = load_device_index('test.svd', self.regice)
+                self.assertEqual(index.get_peripheral_list(), ['TEST1', 'TEST2'])
+                index = load_device_index('test.svd', None)
+                self.assertEqual(index.peripherals, {})
+                self.assertEqual(index.get_peripheral('TEST1').base_address,
+                                 0x00001234)
+                self.assertEqual(list(index.peripherals), ['TEST1'])
+                with self.assertRaises(AttributeError):
+                    load_device_index('test.svd', None, rebuild=True)
+            finally:
+                if saved is None:
+                    del os.environ['XDG_CACHE_HOME']
+                else:
+                    os.environ['XDG_CACHE_HOME'] = saved
+
 def run_tests(module):
     return unittest.main(module=module, exit=False).result
 
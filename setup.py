@@ -41,6 +41,9 @@ setup(
         "Programming Language :: Python :: 3.6",
     ],
     install_requires=['LibRegice'],
+    extras_require={
+        'yaml': ['PyYAML'],
+    },
     dependency_links=[
         'git+https://github.com/BayLibre/libregice.git#egg=LibRegice',
     ],